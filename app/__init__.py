@@ -36,9 +36,11 @@ def _to_datetime(value):
     return None
 
 
-def create_app():
+def create_app(config_overrides: dict | None = None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
 
     # Initialize DB + tables + default admin once, at startup
     with app.app_context():
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from .models.catalog_version import CatalogVersion
+
+
+class CatalogSnapshot:
+    """Catalog data for one shop at one catalog version, filled in lazily."""
+
+    def __init__(self, shop_id: int, version: int):
+        self.shop_id = shop_id
+        self.version = version
+        self._values = {}
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, db, key, loader):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        value = loader()
+        # Uncommitted writes could still roll back; don't keep what they show.
+        if not db.in_transaction:
+            self._values[key] = value
+        return value
+
+
+class CatalogCache:
+    """Per-shop catalog snapshots, LRU-evicted beyond ``max_shops`` shops.
+
+    A snapshot is reused only while the shop's row in ``catalog_versions`` still
+    holds the version it was built at; triggers bump that row on every catalog
+    write, so all workers sharing the database see changes on their next read.
+    """
+
+    def __init__(self, max_shops: int = 32):
+        self.max_shops = max(int(max_shops), 1)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def snapshot(self, db, shop_id: int) -> CatalogSnapshot:
+        # Read the version before any catalog data, so a snapshot never holds
+        # data older than the version it is filed under.
+        version = CatalogVersion.current(db, shop_id)
+        with self._lock:
+            entry = self._entries.get(shop_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(shop_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = CatalogSnapshot(shop_id, version)
+        if not db.in_transaction:
+            with self._lock:
+                self._entries[shop_id] = entry
+                self._entries.move_to_end(shop_id)
+                while len(self._entries) > self.max_shops:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_catalog_cache(app=None) -> CatalogCache:
+    app = app or current_app
+    cache = app.extensions.get("catalog_cache")
+    if cache is None:
+        cache = app.extensions.setdefault(
+            "catalog_cache",
+            CatalogCache(app.config.get("CATALOG_CACHE_SHOPS", 32)),
+        )
+    return cache
+
+
+def get_catalog(db, shop_id: int) -> CatalogSnapshot:
+    return get_catalog_cache().snapshot(db, shop_id)
@@ -9,3 +9,32 @@ class Config:
 
     # Database file name
     DB_PATH = os.path.join(INSTANCE_DIR, "ezzystore.db")
+
+    # SQLite tuning (see app/db.py). Each value can be overridden from the environment.
+    DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+    DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+    # Negative values are KiB, positive values are pages (SQLite semantics).
+    DB_CACHE_SIZE = int(os.environ.get("DB_CACHE_SIZE", "-16000"))
+    DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+    DB_TEMP_STORE = os.environ.get("DB_TEMP_STORE", "MEMORY")
+    # Idle connections kept for reuse across requests; 0 opens one per request.
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+    # Write routes take the write lock up front (BEGIN IMMEDIATE); if that still
+    # reports SQLITE_BUSY, retry this many times with jittered exponential backoff.
+    DB_WRITE_RETRIES = int(os.environ.get("DB_WRITE_RETRIES", "5"))
+    DB_WRITE_BACKOFF_MS = float(os.environ.get("DB_WRITE_BACKOFF_MS", "25"))
+
+    # Group commit: sales and returns are queued to one writer thread and committed
+    # together, every GROUP_COMMIT_WINDOW_MS or GROUP_COMMIT_MAX_BATCH jobs.
+    GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "0").lower() in ("1", "true", "yes", "on")
+    GROUP_COMMIT_WINDOW_MS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", "2"))
+    GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "64"))
+
+    # Live stock stream (/manager/stock/stream): keep-alive interval, and events
+    # buffered per slow client before it is told to resync.
+    SSE_HEARTBEAT_S = float(os.environ.get("SSE_HEARTBEAT_S", "15"))
+    SSE_CLIENT_BUFFER = int(os.environ.get("SSE_CLIENT_BUFFER", "64"))
+
+    # Shops whose catalog (products, brands, categories, restock rates) is kept in memory.
+    CATALOG_CACHE_SHOPS = int(os.environ.get("CATALOG_CACHE_SHOPS", "32"))
@@ -1,22 +1,198 @@
 import os
+import queue
+import random
 import sqlite3
-from flask import current_app, g
+import threading
+import time
+from flask import current_app, g, has_request_context, request
 
 
-def get_db():
-    if "db" not in g:
-        db_path = current_app.config["DB_PATH"]
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+_TEMP_STORES = {"DEFAULT", "FILE", "MEMORY"}
+
+
+def _choice(value, allowed, setting):
+    value = str(value).upper()
+    if value not in allowed:
+        raise ValueError(f"{setting} must be one of {sorted(allowed)}, got {value!r}")
+    return value
+
 
-        conn = sqlite3.connect(db_path)
+class ConnectionPool:
+    """Hands out tuned SQLite connections and keeps a few idle ones for reuse."""
+
+    def __init__(self, config):
+        self.db_path = config["DB_PATH"]
+        self.journal_mode = _choice(config.get("DB_JOURNAL_MODE", "WAL"), _JOURNAL_MODES, "DB_JOURNAL_MODE")
+        self.synchronous = _choice(config.get("DB_SYNCHRONOUS", "NORMAL"), _SYNCHRONOUS_MODES, "DB_SYNCHRONOUS")
+        self.temp_store = _choice(config.get("DB_TEMP_STORE", "MEMORY"), _TEMP_STORES, "DB_TEMP_STORE")
+        self.busy_timeout_ms = int(config.get("DB_BUSY_TIMEOUT_MS", 5000))
+        self.cache_size = int(config.get("DB_CACHE_SIZE", -16000))
+        self.mmap_size = int(config.get("DB_MMAP_SIZE", 0))
+        self.pool_size = max(int(config.get("DB_POOL_SIZE", 0)), 0)
+        self._idle = queue.LifoQueue(maxsize=self.pool_size or 1)
+        self._journal_lock = threading.Lock()
+        self._journal_set = False
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # Pooled connections move between worker threads, but only one request uses a
+        # connection at a time, so the same-thread check can be relaxed.
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms};")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous};")
+        conn.execute(f"PRAGMA cache_size = {self.cache_size};")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_size};")
+        conn.execute(f"PRAGMA temp_store = {self.temp_store};")
+        # journal_mode is stored in the database file; setting it once per pool is enough.
+        with self._journal_lock:
+            if not self._journal_set:
+                conn.execute(f"PRAGMA journal_mode = {self.journal_mode};")
+                self._journal_set = True
+        return conn
+
+    def dedicated(self):
+        """A tuned connection owned by the caller; it never enters the pool."""
+        return self._connect()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        if not self.pool_size:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class WriteStats:
+    """Per-route counters for write-lock acquisition, read by scripts/bench.py."""
+
+    # Acquisitions slower than this count as having waited for another writer.
+    WAIT_THRESHOLD_MS = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route: str, wait_ms: float, retries: int, failed: bool = False):
+        with self._lock:
+            stats = self._routes.setdefault(
+                route,
+                {"transactions": 0, "lock_waits": 0, "wait_ms": 0.0, "max_wait_ms": 0.0, "retries": 0, "failures": 0},
+            )
+            stats["transactions"] += 1
+            stats["retries"] += retries
+            stats["wait_ms"] += wait_ms
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+            if wait_ms >= self.WAIT_THRESHOLD_MS:
+                stats["lock_waits"] += 1
+            if failed:
+                stats["failures"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {route: dict(stats) for route, stats in self._routes.items()}
 
-        g.db = conn
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+def is_busy(exc: sqlite3.OperationalError) -> bool:
+    code = getattr(exc, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(exc) or "busy" in str(exc)
+
+
+def get_write_stats(app=None) -> WriteStats:
+    app = app or current_app
+    stats = app.extensions.get("db_write_stats")
+    if stats is None:
+        stats = app.extensions.setdefault("db_write_stats", WriteStats())
+    return stats
+
+
+class WriteBusy(sqlite3.OperationalError):
+    """begin_write gave up waiting for the write lock; the caller should ask the user to retry."""
+
+
+def begin_write(db, route: str | None = None):
+    """Open a write transaction that holds SQLite's write lock from the start.
+
+    Plain sqlite3 transactions are deferred: they take the lock at the first
+    write and can hit "database is locked" halfway through. BEGIN IMMEDIATE
+    waits for the lock up front (busy_timeout), and is retried with jittered
+    backoff if the wait still ends in SQLITE_BUSY; once the retries run out it
+    raises WriteBusy. Commit or roll back as usual.
+
+    Call it before the first write: sqlite3 opens a deferred transaction on
+    any DML, and one already open here would run without the lock or retry.
+    """
+    if db.in_transaction:
+        raise RuntimeError("begin_write called inside an open transaction; call it before the first write")
+    if route is None:
+        route = (request.endpoint if has_request_context() else None) or "-"
+    config = current_app.config
+    max_retries = int(config.get("DB_WRITE_RETRIES", 5))
+    backoff_ms = float(config.get("DB_WRITE_BACKOFF_MS", 25))
+    stats = get_write_stats()
+
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            db.execute("BEGIN IMMEDIATE;")
+            break
+        except sqlite3.OperationalError as exc:
+            if not is_busy(exc) or attempt >= max_retries:
+                stats.record(route, (time.perf_counter() - started) * 1000, attempt, failed=True)
+                if is_busy(exc):
+                    raise WriteBusy(str(exc)) from exc
+                raise
+            time.sleep(random.uniform(0, backoff_ms * (2 ** attempt)) / 1000)
+            attempt += 1
+    stats.record(route, (time.perf_counter() - started) * 1000, attempt)
+
+
+def get_pool(app=None):
+    app = app or current_app
+    pool = app.extensions.get("db_pool")
+    if pool is None:
+        pool = app.extensions.setdefault("db_pool", ConnectionPool(app.config))
+    return pool
+
+
+def get_db():
+    if "db" not in g:
+        g.db = get_pool().acquire()
     return g.db
 
 
 def close_db(_e=None):
     conn = g.pop("db", None)
     if conn is not None:
-        conn.close()
+        get_pool().release(conn)
@@ -0,0 +1,144 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+from .db import WriteBusy, begin_write, get_pool, is_busy
+
+# How long a request waits for its batch to commit before giving up.
+RESULT_TIMEOUT_S = 30
+
+
+class GroupCommitWriter:
+    """Applies write jobs from many requests on one connection, one commit per batch.
+
+    A job is a callable taking the writer's connection. Each runs inside its own
+    savepoint, so a job that raises is undone without affecting the rest of the
+    batch. Callers get the job's return value (or its exception) only after the
+    batch has committed.
+    """
+
+    def __init__(self, connect, max_batch: int = 64, window_ms: float = 2.0):
+        self._connect = connect
+        self.max_batch = max(int(max_batch), 1)
+        self.window_s = max(float(window_ms), 0.0) / 1000
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, job) -> Future:
+        future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        db = self._connect()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                batch = [first]
+                stopping = False
+                deadline = time.monotonic() + self.window_s
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._apply(db, batch)
+                if stopping:
+                    return
+        finally:
+            db.close()
+
+    def _apply(self, db, batch):
+        outcomes = []
+        try:
+            db.execute("BEGIN IMMEDIATE;")
+            for job, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                db.execute("SAVEPOINT group_commit_job;")
+                try:
+                    result = job(db)
+                except Exception as exc:
+                    db.execute("ROLLBACK TO group_commit_job;")
+                    db.execute("RELEASE group_commit_job;")
+                    outcomes.append((future, None, exc))
+                else:
+                    db.execute("RELEASE group_commit_job;")
+                    outcomes.append((future, result, None))
+            db.commit()
+        except Exception as exc:
+            if db.in_transaction:
+                db.rollback()
+            if isinstance(exc, sqlite3.OperationalError) and is_busy(exc):
+                exc = WriteBusy(str(exc))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self.batches += 1
+        self.jobs += len(outcomes)
+        for future, result, exc in outcomes:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+
+_writer_lock = threading.Lock()
+
+
+def get_group_writer(app=None) -> GroupCommitWriter | None:
+    app = app or current_app
+    if not app.config.get("GROUP_COMMIT"):
+        return None
+    writer = app.extensions.get("group_commit_writer")
+    if writer is None:
+        with _writer_lock:
+            writer = app.extensions.get("group_commit_writer")
+            if writer is None:
+                writer = GroupCommitWriter(
+                    get_pool(app).dedicated,
+                    app.config.get("GROUP_COMMIT_MAX_BATCH", 64),
+                    app.config.get("GROUP_COMMIT_WINDOW_MS", 2.0),
+                )
+                app.extensions["group_commit_writer"] = writer
+    return writer
+
+
+def run_write(db, job):
+    """Run ``job(conn)`` and commit it, returning its result.
+
+    With GROUP_COMMIT on, the job is queued for the writer thread and shares a
+    commit with whatever else arrived in the same window; otherwise it runs on
+    ``db`` in its own BEGIN IMMEDIATE transaction. Either way an exception from
+    the job means none of its writes were kept.
+    """
+    writer = get_group_writer()
+    if writer is not None:
+        return writer.submit(job).result(timeout=RESULT_TIMEOUT_S)
+    begin_write(db)
+    try:
+        result = job(db)
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+    return result
@@ -1,16 +1,27 @@
+import base64
+import json
+import math
 import sqlite3
 from functools import wraps
-from datetime import datetime, date, timedelta
-from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify
-
-from ..db import get_db
-from ..models.product import Product
+from datetime import datetime, date, timedelta, timezone
+from urllib.parse import urlsplit
+from flask import Blueprint, Response, current_app, render_template, session, redirect, url_for, flash, request, jsonify
+
+from ..db import WriteBusy, begin_write, get_db
+from ..catalog_cache import get_catalog
+from ..group_commit import run_write
+from ..stock_events import get_stock_hub
+from ..models.product import CODE_MAX_LENGTH, Product
 from ..models.brand import Brand
 from ..models.category import Category
 from ..models.stock_batch import StockBatch
 from ..models.sale import Sale
-from ..models.customer import Customer
-from ..models.shop_settings import ShopSettings
+from ..models.customer import LEDGER_SORTS, Customer
+from ..models.customer_stats import CustomerStats
+from ..models.shop_settings import ShopSettings, DEFAULT_UTC_OFFSET_MINUTES
+from ..models.catalog_change import CatalogChange
+from ..models.product_search import ProductSearch
+from ..models.product_sales_stats import ProductSalesStats
 
 manager_bp = Blueprint("manager", __name__)
 
@@ -55,88 +66,232 @@ def _redirect_to_page(page: str | None = None):
     return redirect(_url_for_page(page))
 
 
-def _build_manager_context(db, shop, active_page: str):
-    products = Product.all_by_shop(db, shop["id"])
-    brands = Brand.all_by_shop(db, shop["id"])
-    categories = Category.all_by_shop(db, shop["id"])
-    total_products = len(products)
-    total_stock = sum(p["quantity"] for p in products)
-    out_of_stock = sum(1 for p in products if p["quantity"] <= (p["reorder_level"] or 0))
-
-    category_products = {c["id"]: [] for c in categories}
-    brand_products = {b["id"]: [] for b in brands}
-    for p in products:
-        cid = p["category_id"]
-        if cid in category_products:
-            category_products[cid].append(p)
-        bid = p["brand_id"]
-        if bid in brand_products:
-            brand_products[bid].append(p)
-
-    category_counts = {cid: len(items) for cid, items in category_products.items()}
-    brand_counts = {bid: len(items) for bid, items in brand_products.items()}
-    stock_batches = StockBatch.all_by_shop(db, shop["id"])
-    product_latest = {}
-    product_purchase_summary = {}
-    product_purchase_previews = {}
-    product_sale_defaults = {}
-    stock_batch_summary_map = {}
-    for batch in stock_batches:
-        pid = batch["product_id"]
-        if pid not in product_latest:
-            product_latest[pid] = {
-                "purchase_rate": batch["purchase_rate"],
-                "sale_price": batch["sale_price"],
-            }
-        summary = stock_batch_summary_map.setdefault(
-            batch["batch_date"],
-            {
-                "batch_date": batch["batch_date"],
-                "product_count": 0,
-                "total_purchase": 0.0,
-            },
-        )
-        summary["product_count"] += 1
-        summary["total_purchase"] += (batch["purchase_rate"] * batch["quantity"])
-        purchase_summary = product_purchase_summary.setdefault(
-            pid,
-            {
-                "total_batches": 0,
-                "total_quantity": 0,
-                "total_spend": 0.0,
-            },
-        )
-        purchase_summary["total_batches"] += 1
-        purchase_summary["total_quantity"] += batch["quantity"]
-        purchase_summary["total_spend"] += batch["quantity"] * batch["purchase_rate"]
-        previews = product_purchase_previews.setdefault(pid, [])
-        if len(previews) < 3:
-            previews.append(
-                {
-                    "batch_date": batch["batch_date"],
-                    "quantity": batch["quantity"],
-                    "purchase_rate": batch["purchase_rate"],
-                }
-            )
-    for batch in stock_batches:
-        pid = batch["product_id"]
-        if pid not in product_sale_defaults:
-            product_sale_defaults[pid] = batch["sale_price"]
-    stock_batch_summary = sorted(
-        stock_batch_summary_map.values(),
-        key=lambda item: item["batch_date"],
-        reverse=True,
+@manager_bp.errorhandler(WriteBusy)
+def _write_busy(_exc):
+    # begin_write ran out of retries before it got the write lock; nothing
+    # was written, so the user can simply send the form again.
+    message = "The shop is busy saving other changes. Nothing was saved; please try again."
+    if _wants_json():
+        return jsonify({"status": "failed", "error": message}), 503
+    flash(message, "error")
+    referrer = urlsplit(request.referrer or "")
+    if referrer.netloc == request.host and referrer.path.startswith("/manager"):
+        return redirect(referrer.path + (f"?{referrer.query}" if referrer.query else ""))
+    return _redirect_to_page()
+
+
+def _local_today(offset_minutes: int):
+    return (datetime.utcnow() + timedelta(minutes=offset_minutes)).date()
+
+
+def _shop_today(db, shop_id: int):
+    return _local_today(ShopSettings.utc_offset_minutes(db, shop_id))
+
+
+def _catalog_products(db, catalog):
+    # Sales change quantities without bumping the catalog version, so the
+    # cached rows get the live quantities laid over them.
+    products = catalog.get(db, "products", lambda: Product.all_by_shop(db, catalog.shop_id))
+    quantities = Product.quantities(db, catalog.shop_id)
+    return [{**product, "quantity": quantities.get(product["id"], product["quantity"])} for product in products]
+
+
+def _catalog_brands(db, catalog):
+    return catalog.get(db, "brands", lambda: Brand.all_by_shop(db, catalog.shop_id))
+
+
+def _catalog_categories(db, catalog):
+    return catalog.get(db, "categories", lambda: Category.all_by_shop(db, catalog.shop_id))
+
+
+def _catalog_products_by(db, catalog, column: str):
+    grouped = {}
+    for product in _catalog_products(db, catalog):
+        grouped.setdefault(product[column], []).append(product)
+    return grouped
+
+
+def _catalog_lookup(db, catalog, name: str):
+    loaders = {"brands": _catalog_brands, "categories": _catalog_categories}
+    return catalog.get(
+        db,
+        f"{name}_by_id",
+        lambda: {row["id"]: row for row in loaders[name](db, catalog)},
     )
-    today = date.today()
-    today_iso = today.isoformat()
-    shop_settings = ShopSettings.get_for_shop(db, shop["id"])
-    expense_percent = shop_settings["expense_percent"] if shop_settings else 0
 
-    report_start_iso = today_iso
-    report_end_iso = today_iso
-    report_sales = []
-    report_daily_summary = []
-    report_search_performed = False
+
+_CONTEXT_PROVIDERS = {}
+
+# Picker rows rendered with the page; the rest load from /products/search.
+PRODUCT_PICKER_PAGE = 50
+
+
+def _context_provider(*keys):
+    def decorator(fn):
+        for key in keys:
+            _CONTEXT_PROVIDERS[key] = fn
+        return fn
+    return decorator
+
+
+# Context keys each section of manager.html renders. Anything not listed for a
+# page is never computed (and never queried) when that page is served.
+_COMMON_CONTEXT_KEYS = (
+    "shop",
+    "active_page",
+    "today_iso",
+    "total_products",
+    "total_stock",
+    "out_of_stock",
+)
+
+_PAGE_CONTEXT_KEYS = {
+    "products": ("products", "brands", "categories"),
+    "stock": ("restock_picker", "stock_batch_summary", "restock_pages", "picker_page_size"),
+    "sales": ("sale_picker", "expense_percent", "picker_page_size"),
+    "reports": ("report_daily_summary", "report_start", "report_end", "report_search_performed"),
+    "customers": ("customer_insights", "customer_ledger"),
+    "brands": ("brands", "brand_counts"),
+    "categories": ("categories", "category_counts"),
+    "settings": ("expense_percent",),
+}
+
+# Only needed when the dashboard renders its module cards.
+_MODULE_CARD_CONTEXT_KEYS = ("products", "brands", "categories", "customer_count", "recent_sales")
+
+
+class _ManagerContext:
+    """Lazily evaluates context providers, computing each one at most once."""
+
+    def __init__(self, db, shop, active_page: str):
+        self.db = db
+        self.shop = shop
+        self.shop_id = shop["id"]
+        self.active_page = active_page
+        self._catalog = None
+        self._values = {"shop": shop, "active_page": active_page}
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            self._catalog = get_catalog(self.db, self.shop_id)
+        return self._catalog
+
+    def cached(self, key, loader):
+        return self.catalog.get(self.db, key, loader)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values.update(_CONTEXT_PROVIDERS[key](self))
+        return self._values[key]
+
+
+@_context_provider("shop_settings")
+def _provide_shop_settings(ctx):
+    return {"shop_settings": ctx.cached("shop_settings", lambda: ShopSettings.get_for_shop(ctx.db, ctx.shop_id))}
+
+
+@_context_provider("today_iso")
+def _provide_today(ctx):
+    shop_settings = ctx["shop_settings"]
+    offset_minutes = shop_settings["utc_offset_minutes"] if shop_settings else DEFAULT_UTC_OFFSET_MINUTES
+    return {"today_iso": _local_today(offset_minutes).isoformat()}
+
+
+@_context_provider("products")
+def _provide_products(ctx):
+    return {"products": _catalog_products(ctx.db, ctx.catalog)}
+
+
+@_context_provider("brands")
+def _provide_brands(ctx):
+    return {"brands": _catalog_brands(ctx.db, ctx.catalog)}
+
+
+@_context_provider("categories")
+def _provide_categories(ctx):
+    return {"categories": _catalog_categories(ctx.db, ctx.catalog)}
+
+
+@_context_provider("total_products", "total_stock", "out_of_stock")
+def _provide_stock_overview(ctx):
+    # Live, like the quantities in "products": sales do not invalidate the cache.
+    if "products" in ctx:
+        products = ctx["products"]
+        return {
+            "total_products": len(products),
+            "total_stock": sum(p["quantity"] for p in products),
+            "out_of_stock": sum(1 for p in products if p["quantity"] <= (p["reorder_level"] or 0)),
+        }
+    overview = Product.stock_overview(ctx.db, ctx.shop_id)
+    return {
+        "total_products": overview["total_products"],
+        "total_stock": overview["total_stock"],
+        "out_of_stock": overview["out_of_stock"],
+    }
+
+
+@_context_provider("brand_counts")
+def _provide_brand_counts(ctx):
+    return {"brand_counts": ctx.cached("brand_counts", lambda: Product.counts_by_brand(ctx.db, ctx.shop_id))}
+
+
+@_context_provider("category_counts")
+def _provide_category_counts(ctx):
+    return {"category_counts": ctx.cached("category_counts", lambda: Product.counts_by_category(ctx.db, ctx.shop_id))}
+
+
+# Restock dates per page of the stock page's "Recent restocks" list.
+RESTOCK_SUMMARY_PAGE = 30
+
+
+@_context_provider("stock_batch_summary", "restock_pages")
+def _provide_stock_batch_summary(ctx):
+    try:
+        before = datetime.strptime(request.args.get("restocks_before", ""), "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        before = None
+    summary, has_more = StockBatch.summary_by_date(ctx.db, ctx.shop_id, before=before, limit=RESTOCK_SUMMARY_PAGE)
+    next_url = None
+    if summary and has_more:
+        next_url = url_for("manager.stock_page", restocks_before=summary[-1]["batch_date"])
+    return {
+        "stock_batch_summary": summary,
+        "restock_pages": {"first_page": before is None, "next_url": next_url},
+    }
+
+
+# The first page of each product picker, newest first, as /products/search
+# serves the rest; the restock picker lists sold-out products too.
+@_context_provider("restock_picker")
+def _provide_restock_picker(ctx):
+    products, has_more = ProductSearch.search(ctx.db, ctx.shop_id, "", limit=PRODUCT_PICKER_PAGE)
+    return {"restock_picker": {"products": products, "has_more": has_more}}
+
+
+@_context_provider("sale_picker")
+def _provide_sale_picker(ctx):
+    products, has_more = ProductSearch.search(ctx.db, ctx.shop_id, "", limit=PRODUCT_PICKER_PAGE, in_stock=True)
+    return {"sale_picker": {"products": products, "has_more": has_more}}
+
+
+@_context_provider("picker_page_size")
+def _provide_picker_page_size(ctx):
+    return {"picker_page_size": PRODUCT_PICKER_PAGE}
+
+
+@_context_provider("expense_percent")
+def _provide_expense_percent(ctx):
+    shop_settings = ctx["shop_settings"]
+    return {"expense_percent": shop_settings["expense_percent"] if shop_settings else 0}
+
+
+@_context_provider("report_daily_summary", "report_start", "report_end", "report_search_performed")
+def _provide_report(ctx):
+    today = date.fromisoformat(ctx["today_iso"])
 
     def _parse_report_date(raw_value, default_value):
         if not raw_value:
@@ -146,109 +301,129 @@ def _build_manager_context(db, shop, active_page: str):
         except (TypeError, ValueError):
             return default_value
 
-    if active_page == "reports":
-        # Check if user has actually provided date parameters.
-        start_param = request.args.get("sales_report_start")
-        end_param = request.args.get("sales_report_end")
-        report_search_performed = bool(start_param or end_param)
+    # Check if user has actually provided date parameters.
+    start_param = request.args.get("sales_report_start")
+    end_param = request.args.get("sales_report_end")
+    report_search_performed = bool(start_param or end_param)
 
-        if report_search_performed:
-            report_start_date = _parse_report_date(start_param, today)
-            report_end_date = _parse_report_date(end_param, report_start_date)
-        else:
-            # Default to the last 7 days so reports are never empty on load.
-            report_end_date = today
-            report_start_date = today - timedelta(days=6)
-            report_search_performed = True
-
-        if report_end_date < report_start_date:
-            report_end_date = report_start_date
-
-        report_start_iso = report_start_date.isoformat()
-        report_end_iso = report_end_date.isoformat()
-        report_sales = Sale.by_date_with_items(db, shop["id"], report_start_iso, report_end_iso)
-        report_daily_summary = Sale.daily_summary(db, shop["id"], report_start_iso, report_end_iso)
-
-    recent_sales = Sale.recent_with_items(db, shop["id"], limit=5)
-    customers = Customer.all_by_shop(db, shop["id"])
-    customers_serialized = [dict(customer) for customer in customers]
-
-    customer_insights = []
-    for customer in customers:
-        sale_rows = db.execute("""
-            SELECT s.created_at, si.product_id, si.quantity, si.unit_price
-            FROM sales s
-            JOIN sale_items si ON si.sale_id = s.id
-            WHERE s.shop_id = ?
-              AND s.customer_id = ?
-              AND s.sale_type = 'sale';
-        """, (shop["id"], customer["id"])).fetchall()
-
-        total_items = 0
-        sale_total = 0.0
-        purchase_total = 0.0
-        last_purchase = None
-
-        for row in sale_rows:
-            qty = row["quantity"] or 0
-            price = row["unit_price"] or 0.0
-            total_items += qty
-            sale_total += qty * price
-            latest_rates = product_latest.get(row["product_id"]) or {}
-            purchase_total += qty * (latest_rates.get("purchase_rate") or 0.0)
-            created_at = row["created_at"]
-            if created_at and (last_purchase is None or created_at > last_purchase):
-                last_purchase = created_at
-
-        profit_pct = None
-        if purchase_total > 0:
-            profit_pct = ((sale_total - purchase_total) / purchase_total) * 100
-
-        if total_items > 0:
-            customer_insights.append(
-                {
-                    "id": customer["id"],
-                    "name": customer["name"],
-                    "phone": customer["phone"],
-                    "item_count": total_items,
-                    "sale_total": sale_total,
-                    "purchase_total": purchase_total,
-                    "last_purchase": last_purchase,
-                    "profit_pct": profit_pct,
-                }
-            )
+    if report_search_performed:
+        report_start_date = _parse_report_date(start_param, today)
+        report_end_date = _parse_report_date(end_param, report_start_date)
+    else:
+        # Default to the last 7 days so reports are never empty on load.
+        report_end_date = today
+        report_start_date = today - timedelta(days=6)
+        report_search_performed = True
+
+    if report_end_date < report_start_date:
+        report_end_date = report_start_date
 
+    report_start_iso = report_start_date.isoformat()
+    report_end_iso = report_end_date.isoformat()
     return {
-        "shop": shop,
-        "products": products,
-        "brands": brands,
-        "categories": categories,
-        "category_products": category_products,
-        "category_counts": category_counts,
-        "brand_counts": brand_counts,
-        "stock_batches": stock_batches,
-        "stock_batch_summary": stock_batch_summary,
-        "product_latest": product_latest,
-        "product_purchase_summary": product_purchase_summary,
-        "product_purchase_previews": product_purchase_previews,
-        "product_sale_defaults": product_sale_defaults,
-        "recent_sales": recent_sales,
-        "report_sales": report_sales,
-        "report_daily_summary": report_daily_summary,
+        "report_daily_summary": Sale.daily_summary(ctx.db, ctx.shop_id, report_start_iso, report_end_iso),
         "report_start": report_start_iso,
         "report_end": report_end_iso,
         "report_search_performed": report_search_performed,
-        "customers": customers_serialized,
-        "customer_insights": customer_insights,
-        "today_iso": today_iso,
-        "total_products": total_products,
-        "total_stock": total_stock,
-        "out_of_stock": out_of_stock,
-        "active_page": active_page,
-        "expense_percent": expense_percent,
     }
 
 
+@_context_provider("recent_sales")
+def _provide_recent_sales(ctx):
+    return {"recent_sales": Sale.recent_with_items(ctx.db, ctx.shop_id, limit=5)}
+
+
+@_context_provider("customer_count")
+def _provide_customer_count(ctx):
+    return {"customer_count": Customer.count(ctx.db, ctx.shop_id)}
+
+
+# Customer ledger rows per page.
+CUSTOMER_LEDGER_PAGE = 25
+
+
+def _encode_cursor(value, row_id: int) -> str:
+    raw = json.dumps([value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _is_sort_value(value) -> bool:
+    # Whatever a keyset query can bind: forged lists and dicts would make
+    # sqlite3 raise instead of paging.
+    return value is None or (isinstance(value, (str, int, float)) and not isinstance(value, bool))
+
+
+def _decode_cursor(raw: str | None, value_ok=_is_sort_value):
+    """(value, id) from an _encode_cursor token, or None if missing/garbled/forged."""
+    if not raw:
+        return None
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if type(row_id) is not int or not value_ok(value):
+        return None
+    return value, row_id
+
+
+@_context_provider("customer_insights", "customer_ledger")
+def _provide_customer_ledger(ctx):
+    sort = request.args.get("sort", "name")
+    if sort not in LEDGER_SORTS:
+        sort = "name"
+    # Name reads A-Z; recency and value read biggest first.
+    default_dir = "asc" if sort == "name" else "desc"
+    direction = request.args.get("dir", default_dir)
+    if direction not in ("asc", "desc"):
+        direction = default_dir
+    search = request.args.get("q", "").strip()
+    after = _decode_cursor(request.args.get("after"))
+    before = None if after else _decode_cursor(request.args.get("before"))
+
+    insights, has_prev, has_next = Customer.ledger_page(
+        ctx.db,
+        ctx.shop_id,
+        sort=sort,
+        descending=direction == "desc",
+        after=after,
+        before=before,
+        search=search,
+        limit=CUSTOMER_LEDGER_PAGE,
+    )
+    base_args = {"sort": sort, "dir": direction}
+    if search:
+        base_args["q"] = search
+    prev_url = next_url = None
+    if insights and has_prev:
+        first = insights[0]
+        prev_url = url_for("manager.customers_page", before=_encode_cursor(first[sort], first["id"]), **base_args)
+    if insights and has_next:
+        last = insights[-1]
+        next_url = url_for("manager.customers_page", after=_encode_cursor(last[sort], last["id"]), **base_args)
+    return {
+        "customer_insights": insights,
+        "customer_ledger": {
+            "sort": sort,
+            "dir": direction,
+            "q": search,
+            "prev_url": prev_url,
+            "next_url": next_url,
+        },
+    }
+
+
+def _build_manager_context(db, shop, active_page: str, *, show_module_cards: bool = False):
+    ctx = _ManagerContext(db, shop, active_page)
+    keys = list(_PAGE_CONTEXT_KEYS.get(active_page, ()))
+    if show_module_cards:
+        keys.extend(_MODULE_CARD_CONTEXT_KEYS)
+    # Page keys first so the header stats can reuse an already loaded product list.
+    keys.extend(_COMMON_CONTEXT_KEYS)
+    result = {key: ctx[key] for key in keys}
+    result["show_module_cards"] = show_module_cards
+    return result
+
+
 @manager_bp.route("/", methods=["GET"])
 @manager_required
 def dashboard():
@@ -261,9 +436,7 @@ def dashboard():
     page_param = request.args.get("page")
     report_params = request.args.get("sales_report_start") or request.args.get("sales_report_end")
     active_page = page_param or ("reports" if report_params else "products")
-    show_module_cards = False
     ctx = _build_manager_context(db, shop, active_page)
-    ctx["show_module_cards"] = show_module_cards
     return render_template("manager.html", **ctx)
 
 
@@ -299,7 +472,7 @@ def sales_page():
     if not shop:
         flash("No shop assigned to this manager account.", "error")
         return redirect(url_for("auth.logout"))
-    selected_customer_id = None
+    selected_customer = None
     customer_id_raw = request.args.get("customer_id")
     if customer_id_raw:
         try:
@@ -309,11 +482,11 @@ def sales_page():
         else:
             customer = Customer.get_for_shop(db, shop["id"], customer_id)
             if customer:
-                selected_customer_id = customer_id
+                selected_customer = customer
             else:
                 flash("Selected customer not found.", "error")
     ctx = _build_manager_context(db, shop, "sales")
-    ctx["selected_customer_id"] = selected_customer_id
+    ctx["selected_customer"] = selected_customer
     return render_template("manager.html", **ctx)
 
 
@@ -365,10 +538,15 @@ def categories_page():
     return render_template("manager.html", **ctx)
 
 
+def _is_code_conflict(exc: sqlite3.IntegrityError) -> bool:
+    return "products.code" in str(exc)
+
+
 @manager_bp.route("/products/create", methods=["POST"])
 @manager_required
 def create_product():
     name = request.form.get("product_name", "").strip()
+    code = Product.normalize_code(request.form.get("product_code"))
     brand_id_raw = request.form.get("product_brand_id")
     category_id_raw = request.form.get("product_category_id")
     reorder_level_raw = request.form.get("product_reorder_level", "3")
@@ -392,6 +570,9 @@ def create_product():
     if not name:
         flash("Product name is required.", "error")
         return _redirect_after()
+    if code and len(code) > CODE_MAX_LENGTH:
+        flash(f"Product code must be at most {CODE_MAX_LENGTH} characters.", "error")
+        return _redirect_after()
 
     db = get_db()
     shop = _get_manager_shop(db)
@@ -437,12 +618,16 @@ def create_product():
         return _redirect_after()
 
     try:
-        Product.create(db, shop["id"], name, 0.0, brand_id, category_id, reorder_level)
+        begin_write(db)
+        Product.create(db, shop["id"], name, 0.0, brand_id, category_id, reorder_level, code=code)
         db.commit()
         flash("Product registered successfully.", "success")
-    except sqlite3.IntegrityError:
+    except sqlite3.IntegrityError as exc:
         db.rollback()
-        flash("This SKU already exists for your shop.", "error")
+        if _is_code_conflict(exc):
+            flash("Another product already uses this code.", "error")
+        else:
+            flash("This SKU already exists for your shop.", "error")
 
     return _redirect_after()
 
@@ -479,7 +664,7 @@ def add_stock():
                 flash("Enter a valid restock date.", "error")
                 return _redirect_to_page("stock")
         else:
-            batch_date_common = date.today().isoformat()
+            batch_date_common = None
         for idx in range(total):
             try:
                 pid = int(multi_ids[idx])
@@ -532,7 +717,7 @@ def add_stock():
                 flash("Enter a valid restock date.", "error")
                 return _redirect_to_page("stock")
         else:
-            batch_date = date.today().isoformat()
+            batch_date = None
 
         if not product_id or quantity <= 0:
             flash("Select a product and enter a positive quantity.", "error")
@@ -558,28 +743,27 @@ def add_stock():
         flash("No shop assigned.", "error")
         return redirect(url_for("auth.logout"))
 
-    processed = []
+    shop_today_iso = _shop_today(db, shop["id"]).isoformat()
+    if any(entry["quantity"] <= 0 for entry in entries):
+        flash("Quantity must be greater than zero.", "error")
+        return _redirect_to_page("stock")
+    products = Product.many_for_shop(db, shop["id"], [entry["product_id"] for entry in entries])
+    if len(products) != len({entry["product_id"] for entry in entries}):
+        flash("Invalid product selected.", "error")
+        return _redirect_to_page("stock")
+
+    deltas, prices = {}, {}
     for entry in entries:
-        if entry["quantity"] <= 0:
-            flash("Quantity must be greater than zero.", "error")
-            return _redirect_to_page("stock")
-        product = Product.get_for_shop(db, shop["id"], entry["product_id"])
-        if not product:
-            flash("Invalid product selected.", "error")
-            return _redirect_to_page("stock")
-        Product.add_stock(db, product["id"], entry["quantity"], entry["sale_price"])
-        StockBatch.create(
-            db,
-            shop["id"],
-            product["id"],
-            entry["quantity"],
-            entry["purchase_rate"],
-            entry["sale_price"],
-            entry["batch_date"],
-        )
-        processed.append(product["name"])
+        entry["batch_date"] = entry["batch_date"] or shop_today_iso
+        deltas[entry["product_id"]] = deltas.get(entry["product_id"], 0) + entry["quantity"]
+        prices[entry["product_id"]] = entry["sale_price"]
+    begin_write(db)
+    Product.adjust_quantities(db, shop["id"], deltas, prices)
+    StockBatch.create_many(db, shop["id"], entries)
+    processed = [products[entry["product_id"]]["name"] for entry in entries]
 
     db.commit()
+    _publish_stock(db, shop["id"], list(deltas))
     if len(processed) == 1:
         flash(
             f"Restock recorded for {processed[0]} ({entries[0]['quantity']} units at PKR {entries[0]['purchase_rate']:.2f}).",
@@ -590,15 +774,61 @@ def add_stock():
     return _redirect_to_page("stock")
 
 
+def _publish_stock(db, shop_id: int, product_ids):
+    """Push committed quantities for ``product_ids`` to live-stock subscribers."""
+    hub = get_stock_hub()
+    if not product_ids or not hub.has_subscribers(shop_id):
+        return
+    rows = Product.many_for_shop(db, shop_id, product_ids)
+    products = [
+        {
+            "id": row["id"],
+            "quantity": row["quantity"],
+            "reorder_level": row["reorder_level"],
+            "low": row["quantity"] <= (row["reorder_level"] or 0),
+        }
+        for row in rows.values()
+    ]
+    hub.publish(shop_id, "stock", {"products": products})
+    low = [product for product in products if product["low"]]
+    if low:
+        hub.publish(shop_id, "low_stock", {"products": low})
+
+
+class _StockShortage(Exception):
+    def __init__(self, product_ids: list[int]):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+
+class _ReturnExceeded(Exception):
+    """A return asked for more of a sale line than is still unreturned."""
+
+
+def _short_stock_failure(db, shop_id: int, short_ids: list[int], requested: dict, fail):
+    current = Product.many_for_shop(db, shop_id, short_ids)
+    short = [
+        {
+            "product_id": pid,
+            "product_name": current[pid]["name"] if pid in current else None,
+            "requested": requested[pid],
+            "available": current[pid]["quantity"] if pid in current else 0,
+        }
+        for pid in short_ids
+    ]
+    details = ", ".join(f"{line['product_name']} ({line['available']} left)" for line in short)
+    return fail(f"Not enough stock for {details}.", 409, short=short)
+
+
 @manager_bp.route("/sales/record", methods=["POST"])
 @manager_required
 def record_sale():
     is_ajax = request.headers.get("X-Requested-With") == "XMLHttpRequest" or \
         (request.accept_mimetypes and request.accept_mimetypes.best == "application/json")
 
-    def fail(message: str, code: int = 400):
+    def fail(message: str, code: int = 400, **extra):
         if is_ajax:
-            return jsonify({"status": "failed", "error": message}), code
+            return jsonify({"status": "failed", "error": message, **extra}), code
         flash(message, "error")
         return _redirect_to_page("sales")
 
@@ -616,14 +846,18 @@ def record_sale():
         sale_type = "sale"
 
     product_ids = request.form.getlist("sale_product_id[]")
+    # Scanner tills may send barcode / SKU codes instead of product ids.
+    product_codes = request.form.getlist("sale_product_code[]")
     quantities = request.form.getlist("sale_quantity[]")
     prices = request.form.getlist("sale_price[]")
     expense_flags = request.form.getlist("sale_expense[]")
     customer_id_raw = request.form.get("sale_customer_id")
 
-    if not product_ids:
+    if product_ids and product_codes:
+        return fail("Send either product ids or product codes, not both.")
+    if not (product_ids or product_codes):
         return fail("Select at least one product to record a sale or return.")
-    if not (len(product_ids) == len(quantities) == len(prices)):
+    if not (len(product_ids or product_codes) == len(quantities) == len(prices)):
         return fail("Missing sale fields for one of the products.")
 
     db = get_db()
@@ -632,6 +866,13 @@ def record_sale():
         flash("No shop assigned.", "error")
         return redirect(url_for("auth.logout"))
 
+    if product_codes:
+        ids_by_code = Product.ids_for_codes(db, shop["id"], product_codes)
+        unknown = [code for code in product_codes if Product.normalize_code(code) not in ids_by_code]
+        if unknown:
+            return fail(f"Unknown product code: {', '.join(unknown)}.", 404, unknown_codes=unknown)
+        product_ids = [str(ids_by_code[Product.normalize_code(code)]) for code in product_codes]
+
     if expense_flags and len(expense_flags) != len(product_ids):
         return fail("Missing expense selection for one of the products.")
 
@@ -651,6 +892,7 @@ def record_sale():
             customer_id = int(customer_id_raw)
         except (TypeError, ValueError):
             customer_id = None
+    lines = []
     for idx in range(len(product_ids)):
         try:
             pid = int(product_ids[idx])
@@ -662,21 +904,25 @@ def record_sale():
             return fail("Enter a valid quantity.")
         if quantity <= 0:
             return fail("Quantity must be greater than zero.")
-        product = Product.get_for_shop(db, shop["id"], pid)
-        if not product:
-            return fail("Product not found.")
-        if sale_type == "sale" and product["quantity"] < quantity:
-            return fail(f"Not enough stock for {product['name']}.")
+        lines.append((pid, quantity, sale_type == "sale" and expense_flags[idx] == "1", prices[idx]))
+
+    products = Product.many_for_shop(db, shop["id"], [line[0] for line in lines])
+    if len(products) != len({line[0] for line in lines}):
+        return fail("Product not found.")
 
-        use_expense = sale_type == "sale" and expense_flags[idx] == "1"
+    requested = {}
+    for pid, quantity, _, _ in lines:
+        requested[pid] = requested.get(pid, 0) + quantity
+
+    for pid, quantity, use_expense, price_raw in lines:
+        product = products[pid]
         if use_expense:
-            latest_batch = StockBatch.latest_for_product(db, shop["id"], pid)
-            if not latest_batch:
+            if product["last_restock_date"] is None:
                 return fail(f"Add a restock purchase price for {product['name']} before using expense pricing.")
-            purchase_rate = float(latest_batch["purchase_rate"] or 0)
+            purchase_rate = float(product["last_purchase_rate"] or 0)
             price = round(purchase_rate * (1 + (expense_percent / 100)), 2)
         else:
-            price = parse_float(prices[idx], "sale price")
+            price = parse_float(price_raw, "sale price")
             if price is None:
                 return fail("Enter a valid sale price.")
 
@@ -694,18 +940,21 @@ def record_sale():
         if not customer:
             return fail("Selected customer not found.")
 
+    items = [{"product_id": e["product_id"], "quantity": e["quantity"], "unit_price": e["unit_price"]} for e in entries]
+
+    def apply(conn):
+        if sale_type == "sale":
+            # Stock is checked by the decrement itself, not by an earlier read.
+            short_ids = Product.reserve_stock(conn, shop["id"], requested)
+            if short_ids:
+                raise _StockShortage(short_ids)
+        else:
+            Product.adjust_quantities(conn, shop["id"], requested)
+        return Sale.record(conn, shop["id"], sale_type, items, customer_id=customer_id)
+
     try:
-        for entry in entries:
-            delta = -entry["quantity"] if sale_type == "sale" else entry["quantity"]
-            Product.adjust_quantity(db, shop["id"], entry["product_id"], delta)
-        sale_id = Sale.record(
-            db,
-            shop["id"],
-            sale_type,
-            [{"product_id": e["product_id"], "quantity": e["quantity"], "unit_price": e["unit_price"]} for e in entries],
-            customer_id=customer_id,
-        )
-        db.commit()
+        sale_id = run_write(db, apply)
+        _publish_stock(db, shop["id"], list(requested))
         if is_ajax:
             return jsonify(
                 {
@@ -720,6 +969,10 @@ def record_sale():
             flash(f"Recorded sale for {len(entries)} product(s).", "success")
         else:
             flash(f"Recorded return for {len(entries)} product(s).", "success")
+    except _StockShortage as exc:
+        return _short_stock_failure(db, shop["id"], exc.product_ids, requested, fail)
+    except WriteBusy:
+        raise
     except Exception:
         db.rollback()
         if is_ajax:
@@ -729,6 +982,339 @@ def record_sale():
     return _redirect_to_page("sales")
 
 
+# Largest batch a till may flush in one /sales/sync request.
+SALE_SYNC_MAX_ENTRIES = 500
+
+
+def _parse_sync_entry(raw):
+    """Validate one queued till sale; returns (entry, None) or (None, error)."""
+    if not isinstance(raw, dict):
+        return None, "Entry must be an object."
+    client_key = raw.get("client_key")
+    if not isinstance(client_key, str) or not client_key.strip() or len(client_key) > 100:
+        return None, "client_key is required (up to 100 characters)."
+    sale_type = raw.get("sale_type", "sale")
+    if sale_type not in ("sale", "return"):
+        return None, "sale_type must be 'sale' or 'return'."
+
+    customer_id = raw.get("customer_id")
+    if customer_id is not None and (isinstance(customer_id, bool) or not isinstance(customer_id, int)):
+        return None, "customer_id must be an integer."
+
+    created_at = raw.get("created_at")
+    if created_at is not None:
+        try:
+            stamp = datetime.fromisoformat(str(created_at))
+        except ValueError:
+            return None, "created_at must be an ISO 8601 timestamp."
+        if stamp.tzinfo is not None:
+            stamp = stamp.astimezone(timezone.utc).replace(tzinfo=None)
+        created_at = stamp.strftime("%Y-%m-%d %H:%M:%S")
+
+    items = raw.get("items")
+    if not isinstance(items, list) or not items:
+        return None, "items must be a non-empty list."
+    parsed_items = []
+    for item in items:
+        if not isinstance(item, dict):
+            return None, "Each item must be an object."
+        try:
+            product_id = int(item["product_id"])
+            quantity = int(item["quantity"])
+            unit_price = float(item["unit_price"])
+        except (KeyError, TypeError, ValueError):
+            return None, "Each item needs product_id, quantity and unit_price."
+        if quantity <= 0:
+            return None, "Quantity must be greater than zero."
+        # float() accepts "nan" and "inf", which would poison every total they reach.
+        if not math.isfinite(unit_price) or unit_price < 0:
+            return None, "Enter a valid sale price."
+        parsed_items.append({"product_id": product_id, "quantity": quantity, "unit_price": unit_price})
+
+    return {
+        "client_key": client_key.strip(),
+        "sale_type": sale_type,
+        "customer_id": customer_id,
+        "created_at": created_at,
+        "items": parsed_items,
+    }, None
+
+
+@manager_bp.route("/sales/sync", methods=["POST"])
+@manager_required
+def sync_sales():
+    """Record a batch of sales/returns queued by an offline till.
+
+    Each entry carries a client_key; an entry whose key is already recorded
+    reports "duplicate" with the original sale id instead of selling again, so
+    a till can safely resend a whole batch after a dropped connection.
+    """
+    payload = request.get_json(silent=True)
+    raw_entries = payload.get("sales") if isinstance(payload, dict) else None
+    if not isinstance(raw_entries, list) or not raw_entries:
+        return jsonify({"status": "failed", "error": "Send a JSON object with a non-empty \"sales\" list."}), 400
+    if len(raw_entries) > SALE_SYNC_MAX_ENTRIES:
+        return jsonify({"status": "failed", "error": f"Send at most {SALE_SYNC_MAX_ENTRIES} sales per request."}), 413
+
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        return jsonify({"status": "failed", "error": "No shop assigned"}), 403
+
+    results = [None] * len(raw_entries)
+    pending = []
+    for idx, raw in enumerate(raw_entries):
+        entry, error = _parse_sync_entry(raw)
+        if error:
+            client_key = raw.get("client_key") if isinstance(raw, dict) else None
+            results[idx] = {"client_key": client_key, "status": "failed", "error": error}
+        else:
+            pending.append((idx, entry))
+
+    products = Product.many_for_shop(
+        db, shop["id"], [item["product_id"] for _, entry in pending for item in entry["items"]]
+    )
+    customers = Customer.existing_ids(
+        db, shop["id"], [entry["customer_id"] for _, entry in pending if entry["customer_id"] is not None]
+    )
+    valid = []
+    for idx, entry in pending:
+        if any(item["product_id"] not in products for item in entry["items"]):
+            results[idx] = {"client_key": entry["client_key"], "status": "failed", "error": "Product not found."}
+        elif entry["customer_id"] is not None and entry["customer_id"] not in customers:
+            results[idx] = {"client_key": entry["client_key"], "status": "failed", "error": "Selected customer not found."}
+        else:
+            valid.append((idx, entry))
+
+    def apply(conn):
+        outcomes = []
+        for idx, entry in valid:
+            key = entry["client_key"]
+            requested = {}
+            for item in entry["items"]:
+                requested[item["product_id"]] = requested.get(item["product_id"], 0) + item["quantity"]
+
+            conn.execute("SAVEPOINT sale_sync_entry;")
+            try:
+                existing_id = Sale.id_for_client_key(conn, shop["id"], key)
+                if existing_id is not None:
+                    outcomes.append((idx, {"client_key": key, "status": "duplicate", "sale_id": existing_id}))
+                    conn.execute("RELEASE sale_sync_entry;")
+                    continue
+                if entry["sale_type"] == "sale":
+                    short_ids = Product.reserve_stock(conn, shop["id"], requested)
+                    if short_ids:
+                        conn.execute("ROLLBACK TO sale_sync_entry;")
+                        conn.execute("RELEASE sale_sync_entry;")
+                        current = Product.many_for_shop(conn, shop["id"], short_ids)
+                        short = [
+                            {
+                                "product_id": pid,
+                                "product_name": products[pid]["name"],
+                                "requested": requested[pid],
+                                "available": current[pid]["quantity"] if pid in current else 0,
+                            }
+                            for pid in short_ids
+                        ]
+                        outcomes.append((idx, {"client_key": key, "status": "failed", "error": "Not enough stock.", "short": short}))
+                        continue
+                else:
+                    Product.adjust_quantities(conn, shop["id"], requested)
+                sale_id = Sale.record(
+                    conn,
+                    shop["id"],
+                    entry["sale_type"],
+                    entry["items"],
+                    customer_id=entry["customer_id"],
+                    client_key=key,
+                    created_at=entry["created_at"],
+                )
+            except sqlite3.IntegrityError:
+                # Another request recorded the same key first.
+                conn.execute("ROLLBACK TO sale_sync_entry;")
+                conn.execute("RELEASE sale_sync_entry;")
+                existing_id = Sale.id_for_client_key(conn, shop["id"], key)
+                if existing_id is not None:
+                    outcomes.append((idx, {"client_key": key, "status": "duplicate", "sale_id": existing_id}))
+                else:
+                    outcomes.append((idx, {"client_key": key, "status": "failed", "error": "Failed to record sale/return."}))
+                continue
+            conn.execute("RELEASE sale_sync_entry;")
+            outcomes.append((idx, {"client_key": key, "status": "recorded", "sale_id": sale_id}))
+        return outcomes
+
+    if valid:
+        try:
+            for idx, outcome in run_write(db, apply):
+                results[idx] = outcome
+        except WriteBusy:
+            # Nothing was recorded; the till keeps the batch and retries it.
+            return jsonify({"status": "failed", "error": "The shop is busy. Retry the sync."}), 503
+        except Exception:
+            db.rollback()
+            return jsonify({"status": "failed", "error": "Failed to record sales."}), 500
+        _publish_stock(db, shop["id"], {
+            item["product_id"]
+            for idx, entry in valid
+            if results[idx]["status"] == "recorded"
+            for item in entry["items"]
+        })
+
+    counts = {}
+    for outcome in results:
+        counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+    return jsonify({"status": "ok", "counts": counts, "results": results})
+
+
+@manager_bp.route("/stock/stream", methods=["GET"])
+@manager_required
+def stock_stream():
+    """Server-Sent Events: stock levels for the manager's shop after each committed change.
+
+    Events are "stock" and "low_stock" ({"products": [{id, quantity,
+    reorder_level, low}]}), and "reset" when this client fell too far behind and
+    missed some. A comment line is sent every SSE_HEARTBEAT_S seconds so dead
+    connections are noticed and proxies keep the stream open.
+    """
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        return jsonify({"status": "failed", "error": "No shop assigned"}), 403
+
+    hub = get_stock_hub()
+    heartbeat_s = float(current_app.config.get("SSE_HEARTBEAT_S", 15))
+    shop_id = shop["id"]
+
+    # Runs after the request (and its DB connection) has been released.
+    def stream():
+        subscription = hub.subscribe(shop_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                event = subscription.get(timeout=heartbeat_s)
+                if event is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                name, data = event
+                yield f"event: {name}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@manager_bp.route("/products/scan", methods=["GET"])
+@manager_required
+def scan_product():
+    """Barcode / SKU lookup for scanner checkouts: one indexed query per scan."""
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        return jsonify({"status": "failed", "error": "No shop assigned"}), 403
+
+    code = Product.normalize_code(request.args.get("code"))
+    if not code:
+        return jsonify({"status": "failed", "error": "code is required."}), 400
+    product = Product.by_code(db, shop["id"], code)
+    if not product:
+        return jsonify({"status": "failed", "error": f"No product with code {code}."}), 404
+    return jsonify({"status": "ok", "product": dict(product)})
+
+
+# Products returned per /products/search request, at most.
+PRODUCT_SEARCH_MAX_LIMIT = 100
+
+
+@manager_bp.route("/products/search", methods=["GET"])
+@manager_required
+def product_search():
+    """Prefix search over product, brand and category names for the pickers.
+
+    ``q`` matches every word as a prefix (an empty ``q`` lists the catalog);
+    ``in_stock=1`` skips sold-out products; ``ids=1,2`` fetches specific
+    products instead, e.g. to restore a draft.
+    """
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        return jsonify({"status": "failed", "error": "No shop assigned"}), 403
+
+    raw_ids = request.args.get("ids", "").strip()
+    if raw_ids:
+        try:
+            ids = [int(part) for part in raw_ids.split(",") if part.strip()]
+        except ValueError:
+            return jsonify({"status": "failed", "error": "ids must be comma-separated integers."}), 400
+        if len(ids) > PRODUCT_SEARCH_MAX_LIMIT:
+            return jsonify({"status": "failed", "error": f"Ask for at most {PRODUCT_SEARCH_MAX_LIMIT} ids."}), 400
+        return jsonify({"status": "ok", "products": ProductSearch.by_ids(db, shop["id"], ids), "has_more": False})
+
+    try:
+        limit = min(max(int(request.args.get("limit", PRODUCT_PICKER_PAGE)), 1), PRODUCT_SEARCH_MAX_LIMIT)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"status": "failed", "error": "limit and offset must be integers."}), 400
+    in_stock = request.args.get("in_stock") in ("1", "true", "on")
+
+    products, has_more = ProductSearch.search(
+        db,
+        shop["id"],
+        request.args.get("q", ""),
+        limit=limit,
+        offset=offset,
+        in_stock=in_stock,
+    )
+    return jsonify({
+        "status": "ok",
+        "products": products,
+        "has_more": has_more,
+        "next_offset": offset + len(products),
+    })
+
+
+# Change-log rows returned per /changes request, at most.
+CHANGE_FEED_MAX_LIMIT = 500
+
+
+@manager_bp.route("/changes", methods=["GET"])
+@manager_required
+def catalog_changes():
+    """Products, brands, categories and customers changed since ``cursor``.
+
+    Without a cursor (or when the log no longer reaches back to it) the
+    response only carries the current cursor and ``"reset": true``: the client
+    reloads its copy in full, then polls from that cursor.
+    """
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        return jsonify({"status": "failed", "error": "No shop assigned"}), 403
+
+    try:
+        limit = min(max(int(request.args.get("limit", CHANGE_FEED_MAX_LIMIT)), 1), CHANGE_FEED_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"status": "failed", "error": "limit must be an integer."}), 400
+    raw_cursor = request.args.get("cursor", "").strip()
+    if raw_cursor:
+        try:
+            cursor = int(raw_cursor)
+        except ValueError:
+            return jsonify({"status": "failed", "error": "cursor must be an integer."}), 400
+    else:
+        cursor = None
+
+    # A client that has not seen every pruned change must reload in full.
+    if cursor is None or cursor < CatalogChange.pruned_through(db):
+        return jsonify({"status": "ok", "reset": True, "cursor": CatalogChange.latest_cursor(db, shop["id"]), "changes": {}, "has_more": False})
+
+    changes, next_cursor, has_more = CatalogChange.since(db, shop["id"], cursor, limit)
+    return jsonify({"status": "ok", "reset": False, "cursor": next_cursor, "changes": changes, "has_more": has_more})
+
+
 @manager_bp.route("/settings", methods=["GET", "POST"])
 @manager_required
 def settings_page():
@@ -747,6 +1333,7 @@ def settings_page():
         except ValueError:
             flash("Enter a valid expense percentage.", "error")
             return redirect(url_for("manager.settings_page"))
+        begin_write(db)
         ShopSettings.set_expense_percent(db, shop["id"], expense_percent)
         db.commit()
         flash("Settings updated.", "success")
@@ -866,6 +1453,7 @@ def sale_return(sale_id: int):
                 "product_id": sale_item["product_id"],
                 "quantity": qty,
                 "unit_price": price,
+                "unit_cost": sale_item["unit_cost"],
                 "product_name": sale_item["product_name"],
                 "sale_item_id": sale_item["id"],
             }
@@ -875,41 +1463,45 @@ def sale_return(sale_id: int):
         flash("Nothing selected to return.", "error")
         return _redirect_to_page("sales")
 
-    try:
-        processed_items = []
-        for entry in entries:
-            Product.adjust_quantity(db, shop["id"], entry["product_id"], entry["quantity"])
-            processed_items.append(
-                {
-                    "product_id": entry["product_id"],
-                    "quantity": entry["quantity"],
-                    "unit_price": entry["unit_price"],
-                }
-            )
+    restocked, returned = {}, {}
+    for entry in entries:
+        restocked[entry["product_id"]] = restocked.get(entry["product_id"], 0) + entry["quantity"]
+        returned[entry["sale_item_id"]] = returned.get(entry["sale_item_id"], 0) + entry["quantity"]
+    # Returned goods go back at the cost they were sold at.
+    items = [
+        {
+            "product_id": e["product_id"],
+            "quantity": e["quantity"],
+            "unit_price": e["unit_price"],
+            "unit_cost": e["unit_cost"],
+            "product_name": e["product_name"],
+        }
+        for e in entries
+    ]
+
+    def apply(conn):
+        # Checked again under the write lock: a concurrent return of the same
+        # lines may have committed since the form was validated above.
+        if Sale.mark_returned(conn, returned):
+            raise _ReturnExceeded()
+        Product.adjust_quantities(conn, shop["id"], restocked)
         Sale.record(
-            db,
+            conn,
             shop["id"],
             "return",
-            processed_items,
+            items,
             customer_id=sale["customer_id"],
             reference_sale_id=sale["id"],
         )
-        for entry in entries:
-            sale_item = sale_item_lookup.get(str(entry["sale_item_id"]))
-            current_returned = sale_item.get("returned_quantity") or 0
-            total_returned = current_returned + entry["quantity"]
-            if total_returned >= sale_item["quantity"]:
-                db.execute(
-                    "UPDATE sale_items SET returned_quantity = ?, returned_at = datetime('now') WHERE id = ?",
-                    (sale_item["quantity"], entry["sale_item_id"]),
-                )
-            else:
-                db.execute(
-                    "UPDATE sale_items SET returned_quantity = ?, returned_at = NULL WHERE id = ?",
-                    (total_returned, entry["sale_item_id"]),
-                )
-        db.commit()
+
+    try:
+        run_write(db, apply)
+        _publish_stock(db, shop["id"], list(restocked))
         flash(f"Recorded return for {len(entries)} product(s).", "success")
+    except _ReturnExceeded:
+        flash("Some of these items have already been returned. Nothing was recorded.", "error")
+    except WriteBusy:
+        raise
     except Exception:
         db.rollback()
         flash("Failed to record return.", "error")
@@ -935,6 +1527,7 @@ def create_brand():
         return redirect(url_for("auth.logout"))
 
     try:
+        begin_write(db)
         Brand.create(db, shop["id"], name)
         db.commit()
         flash("Brand added.", "success")
@@ -973,6 +1566,7 @@ def update_brand():
         return _redirect_to_page("brands")
 
     try:
+        begin_write(db)
         Brand.update(db, shop["id"], brand_id, name)
         db.commit()
         flash("Brand updated.", "success")
@@ -988,6 +1582,7 @@ def update_brand():
 def update_product():
     product_id = request.form.get("edit_product_id")
     name = request.form.get("edit_product_name", "").strip()
+    code_raw = request.form.get("edit_product_code")
     brand_id_raw = request.form.get("edit_product_brand_id")
     category_id_raw = request.form.get("edit_product_category_id")
     reorder_level_raw = request.form.get("edit_product_reorder_level", "3")
@@ -1062,8 +1657,14 @@ def update_product():
         return _redirect_after()
 
     current_price = product["price"]
+    # Forms without a code field leave the product's code as it is.
+    code = product["code"] if code_raw is None else Product.normalize_code(code_raw)
+    if code and len(code) > CODE_MAX_LENGTH:
+        flash(f"Product code must be at most {CODE_MAX_LENGTH} characters.", "error")
+        return _redirect_after()
 
     try:
+        begin_write(db)
         Product.update(
             db,
             shop["id"],
@@ -1073,12 +1674,16 @@ def update_product():
             brand_id=brand_id if brand_id is not None else product["brand_id"],
             category_id=category_id if category_id is not None else product["category_id"],
             reorder_level=reorder_level,
+            code=code,
         )
         db.commit()
         flash("Product updated.", "success")
-    except sqlite3.IntegrityError:
+    except sqlite3.IntegrityError as exc:
         db.rollback()
-        flash("SKU already exists.", "error")
+        if _is_code_conflict(exc):
+            flash("Another product already uses this code.", "error")
+        else:
+            flash("SKU already exists.", "error")
 
     return _redirect_after()
 
@@ -1105,6 +1710,7 @@ def delete_product():
         flash("Product not found.", "error")
         return _redirect_to_page("products")
 
+    begin_write(db)
     Product.delete(db, shop["id"], product_id)
     db.commit()
     flash(f"Removed {product['name']}.", "success")
@@ -1126,15 +1732,15 @@ def brand_detail(brand_id: int):
         flash("Invalid brand.", "error")
         return _redirect_to_page("brands")
 
-    brand = Brand.get_by_id(db, shop["id"], brand_id)
+    catalog = get_catalog(db, shop["id"])
+    brand = _catalog_lookup(db, catalog, "brands").get(brand_id)
     if not brand:
         flash("Brand not found.", "error")
         return _redirect_to_page("brands")
 
-    products = Product.all_by_shop(db, shop["id"])
-    brand_products = [p for p in products if p["brand_id"] == brand_id]
-    categories = Category.all_by_shop(db, shop["id"])
-    brands = Brand.all_by_shop(db, shop["id"])
+    brand_products = _catalog_products_by(db, catalog, "brand_id").get(brand_id, [])
+    categories = _catalog_categories(db, catalog)
+    brands = _catalog_brands(db, catalog)
 
     return render_template(
         "brand_detail.html",
@@ -1233,6 +1839,79 @@ def product_purchases(product_id: int):
     )
 
 
+# Sale lines per page of a product's sales history.
+PRODUCT_SALES_PAGE = 50
+
+
+def _is_running_totals(value) -> bool:
+    # product_sales pages carry [sold, returned] to date rather than a sort value.
+    return isinstance(value, list) and len(value) == 2 and all(type(n) is int for n in value)
+
+
+@manager_bp.route("/products/<int:product_id>/sales", methods=["GET"])
+@manager_required
+def product_sales(product_id: int):
+    """Who bought this product and when: its sale and return lines, newest first.
+
+    Each line shows the running sold / returned units up to and including it.
+    The next-page cursor carries the running totals along, so no page has to
+    add up the lines before it.
+    """
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        flash("No shop assigned.", "error")
+        return redirect(url_for("auth.logout"))
+
+    product = Product.get_for_shop(db, shop["id"], product_id)
+    if not product:
+        flash("Product not found.", "error")
+        return _redirect_to_page("products")
+
+    stats = ProductSalesStats.get(db, shop["id"], product_id)
+    totals = {
+        "sold_quantity": stats["sold_quantity"] if stats else 0,
+        "returned_quantity": stats["returned_quantity"] if stats else 0,
+        "sales_total": stats["sales_total"] if stats else 0.0,
+        "returns_total": stats["returns_total"] if stats else 0.0,
+    }
+
+    before_id = None
+    running_sold, running_returned = totals["sold_quantity"], totals["returned_quantity"]
+    cursor = _decode_cursor(request.args.get("before"), value_ok=_is_running_totals)
+    if cursor:
+        (running_sold, running_returned), before_id = cursor
+
+    lines, has_more = Sale.product_lines_page(
+        db, shop["id"], product_id, before=before_id, limit=PRODUCT_SALES_PAGE
+    )
+    entries = []
+    for line in lines:
+        entries.append({**dict(line), "running_sold": running_sold, "running_returned": running_returned})
+        if line["sale_type"] == "sale":
+            running_sold -= line["quantity"]
+        else:
+            running_returned -= line["quantity"]
+
+    next_url = None
+    if lines and has_more:
+        next_url = url_for(
+            "manager.product_sales",
+            product_id=product_id,
+            before=_encode_cursor([running_sold, running_returned], lines[-1]["id"]),
+        )
+
+    return render_template(
+        "product_sales.html",
+        shop=shop,
+        product=product,
+        totals=totals,
+        entries=entries,
+        first_page=before_id is None,
+        next_url=next_url,
+    )
+
+
 @manager_bp.route("/categories/<int:category_id>", methods=["GET"])
 @manager_required
 def category_detail(category_id: int):
@@ -1248,15 +1927,15 @@ def category_detail(category_id: int):
         flash("Invalid category.", "error")
         return _redirect_to_page("categories")
 
-    category = Category.get_by_id(db, shop["id"], category_id)
+    catalog = get_catalog(db, shop["id"])
+    category = _catalog_lookup(db, catalog, "categories").get(category_id)
     if not category:
         flash("Category not found.", "error")
         return _redirect_to_page("categories")
 
-    products = Product.all_by_shop(db, shop["id"])
-    category_products = [p for p in products if p["category_id"] == category_id]
-    brands = Brand.all_by_shop(db, shop["id"])
-    categories = Category.all_by_shop(db, shop["id"])
+    category_products = _catalog_products_by(db, catalog, "category_id").get(category_id, [])
+    brands = _catalog_brands(db, catalog)
+    categories = _catalog_categories(db, catalog)
 
     return render_template(
         "category_detail.html",
@@ -1283,6 +1962,7 @@ def create_category():
         return redirect(url_for("auth.logout"))
 
     try:
+        begin_write(db)
         Category.create(db, shop["id"], name)
         db.commit()
         flash("Category added.", "success")
@@ -1321,6 +2001,7 @@ def update_category():
         return _redirect_to_page("categories")
 
     try:
+        begin_write(db)
         Category.update(db, shop["id"], category_id, name)
         db.commit()
         flash("Category updated.", "success")
@@ -1367,6 +2048,154 @@ def sales_report_detail(report_date: str):
     )
 
 
+# Sales journal rows per page.
+SALES_JOURNAL_PAGE = 25
+
+
+def _wants_json() -> bool:
+    return request.headers.get("X-Requested-With") == "XMLHttpRequest" or \
+        (request.accept_mimetypes and request.accept_mimetypes.best == "application/json")
+
+
+def _optional_int_arg(name: str):
+    try:
+        return int(request.args[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+@manager_bp.route("/sales/journal", methods=["GET"])
+@manager_required
+def sales_journal():
+    """Every sale and return, newest first, a page at a time.
+
+    Optional ``type`` (sale/return), ``customer_id`` and ``product_id``
+    filters; ``before`` is the cursor from the previous page's next link.
+    Serves JSON to XHR / ``Accept: application/json`` clients.
+    """
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        if _wants_json():
+            return jsonify({"status": "failed", "error": "No shop assigned"}), 403
+        flash("No shop assigned.", "error")
+        return redirect(url_for("auth.logout"))
+
+    sale_type = request.args.get("type")
+    if sale_type not in ("sale", "return"):
+        sale_type = None
+    customer_id = _optional_int_arg("customer_id")
+    product_id = _optional_int_arg("product_id")
+    customer = Customer.get_for_shop(db, shop["id"], customer_id) if customer_id is not None else None
+    product = Product.get_for_shop(db, shop["id"], product_id) if product_id is not None else None
+
+    entries, has_more = Sale.journal_page(
+        db,
+        shop["id"],
+        before=_decode_cursor(request.args.get("before")),
+        customer_id=customer_id,
+        product_id=product_id,
+        sale_type=sale_type,
+        limit=SALES_JOURNAL_PAGE,
+    )
+    filter_args = {
+        key: value
+        for key, value in (("type", sale_type), ("customer_id", customer_id), ("product_id", product_id))
+        if value is not None
+    }
+    next_cursor = None
+    if entries and has_more:
+        last = entries[-1]["sale"]
+        next_cursor = _encode_cursor(last["created_at"], last["id"])
+
+    if _wants_json():
+        return jsonify({
+            "status": "ok",
+            "sales": [{**dict(entry["sale"]), "items": entry["sale_items"]} for entry in entries],
+            "next_cursor": next_cursor,
+        })
+
+    return render_template(
+        "sales_journal.html",
+        shop=shop,
+        entries=entries,
+        sale_type=sale_type,
+        customer=customer,
+        product=product,
+        filter_args=filter_args,
+        first_page=request.args.get("before") is None,
+        next_url=url_for("manager.sales_journal", before=next_cursor, **filter_args) if next_cursor else None,
+    )
+
+
+# Sales per page of a customer's purchase history.
+CUSTOMER_HISTORY_PAGE = 25
+
+
+@manager_bp.route("/customers/<int:customer_id>", methods=["GET"])
+@manager_required
+def customer_history(customer_id: int):
+    """One customer's sales and returns, newest first, with their ledger totals.
+
+    Optional ``type`` (sale/return) filter; ``before`` is the cursor from the
+    previous page's next link. Serves JSON to XHR / ``Accept: application/json``
+    clients.
+    """
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        if _wants_json():
+            return jsonify({"status": "failed", "error": "No shop assigned"}), 403
+        flash("No shop assigned.", "error")
+        return redirect(url_for("auth.logout"))
+
+    customer = Customer.get_for_shop(db, shop["id"], customer_id)
+    if not customer:
+        if _wants_json():
+            return jsonify({"status": "failed", "error": "Customer not found"}), 404
+        flash("Customer not found.", "error")
+        return _redirect_to_page("customers")
+
+    sale_type = request.args.get("type")
+    if sale_type not in ("sale", "return"):
+        sale_type = None
+    filter_args = {"type": sale_type} if sale_type else {}
+
+    entries, has_more = Sale.journal_page(
+        db,
+        shop["id"],
+        before=_decode_cursor(request.args.get("before")),
+        customer_id=customer["id"],
+        sale_type=sale_type,
+        limit=CUSTOMER_HISTORY_PAGE,
+    )
+    next_cursor = None
+    if entries and has_more:
+        last = entries[-1]["sale"]
+        next_cursor = _encode_cursor(last["created_at"], last["id"])
+
+    if _wants_json():
+        return jsonify({
+            "status": "ok",
+            "sales": [{**dict(entry["sale"]), "items": entry["sale_items"]} for entry in entries],
+            "next_cursor": next_cursor,
+        })
+
+    return render_template(
+        "customer_history.html",
+        shop=shop,
+        customer=customer,
+        stats=CustomerStats.get(db, shop["id"], customer["id"]),
+        entries=entries,
+        sale_type=sale_type,
+        filter_args=filter_args,
+        first_page=request.args.get("before") is None,
+        next_url=url_for(
+            "manager.customer_history", customer_id=customer["id"], before=next_cursor, **filter_args
+        ) if next_cursor else None,
+    )
+
+
 @manager_bp.route("/customers/create", methods=["POST"])
 @manager_required
 def create_customer():
@@ -1395,6 +2224,7 @@ def create_customer():
 
     created_customer_id = None
     try:
+        begin_write(db)
         created_customer_id = Customer.create(db, shop["id"], name, phone if phone else None)
         db.commit()
         flash("Customer added.", "success")
@@ -1408,6 +2238,26 @@ def create_customer():
     return _redirect_after(created_customer_id)
 
 
+# Typeahead matches returned per /customers/lookup request, at most.
+CUSTOMER_LOOKUP_MAX_LIMIT = 50
+
+
+@manager_bp.route("/customers/lookup", methods=["GET"])
+@manager_required
+def customer_lookup():
+    """Typeahead for the customer picker: name or phone prefix, any case."""
+    db = get_db()
+    shop = _get_manager_shop(db)
+    if not shop:
+        return jsonify({"status": "failed", "error": "No shop assigned"}), 403
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), CUSTOMER_LOOKUP_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"status": "failed", "error": "limit must be an integer."}), 400
+    customers = Customer.lookup(db, shop["id"], request.args.get("q", ""), limit)
+    return jsonify({"status": "ok", "customers": [dict(customer) for customer in customers]})
+
+
 @manager_bp.route("/customers/delete", methods=["POST"])
 @manager_required
 def delete_customer():
@@ -1430,6 +2280,7 @@ def delete_customer():
         flash("Customer not found.", "error")
         return _redirect_to_page("customers")
 
+    begin_write(db)
     Customer.delete(db, shop["id"], customer_id)
     db.commit()
     flash(f"Removed customer {customer['name']}.", "success")
@@ -6,6 +6,14 @@ from .stock_batch import StockBatch
 from .sale import Sale
 from .customer import Customer
 from .shop_settings import ShopSettings
+from .daily_sales_rollup import DailySalesRollup
+from .restock_rollup import RestockRollup
+from .customer_stats import CustomerStats
+from .product_sales_stats import ProductSalesStats
+from .catalog_version import CatalogVersion
+from .catalog_change import CatalogChange
+from .product_search import ProductSearch
+from .migrations import apply_migrations
 
 def init_models(db):
     User.create_table(db)
@@ -40,5 +48,15 @@ def init_models(db):
     Customer.create_table(db)
     Sale.create_table(db)
     ShopSettings.create_table(db)
+    DailySalesRollup.create_table(db)
+    RestockRollup.create_table(db)
+    CustomerStats.create_table(db)
+    ProductSalesStats.create_table(db)
+    CatalogVersion.create_table(db)
+    CatalogChange.create_table(db)
+    ProductSearch.create_table(db)
+
+    # Versioned steps (indexes, backfills) tracked via PRAGMA user_version.
+    apply_migrations(db)
 
     User.ensure_default_admin(db)
@@ -0,0 +1,121 @@
+# entity name -> (table, columns a client needs to refresh its copy of a row)
+CHANGE_ENTITIES = {
+    "products": ("products", ("id", "name", "code", "price", "quantity", "reorder_level", "brand_id", "category_id")),
+    "brands": ("brands", ("id", "name")),
+    "categories": ("categories", ("id", "name")),
+    "customers": ("customers", ("id", "name", "phone")),
+}
+
+
+class CatalogChange:
+    @staticmethod
+    def create_table(db):
+        # Append-only: one row per changed row, in commit order (writers are
+        # serialized, so ids never become visible out of order). No FK to shops,
+        # so the log can record a shop's rows being cascaded away.
+        db.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+          id         INTEGER PRIMARY KEY AUTOINCREMENT,
+          shop_id    INTEGER NOT NULL,
+          entity     TEXT NOT NULL,
+          entity_id  INTEGER NOT NULL,
+          op         TEXT NOT NULL CHECK(op IN ('upsert','delete')),
+          changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS ix_catalog_changes_shop ON catalog_changes(shop_id, id);")
+
+        # Triggers rather than model calls, so restocks and sales (which update
+        # products.quantity/price) and maintenance scripts are logged too.
+        for entity, (table, columns) in CHANGE_ENTITIES.items():
+            watched = " OR ".join(f"OLD.{col} IS NOT NEW.{col}" for col in columns if col != "id")
+            for event, row, op, when in (
+                ("INSERT", "NEW", "upsert", ""),
+                ("UPDATE", "NEW", "upsert", f"WHEN {watched}"),
+                ("DELETE", "OLD", "delete", ""),
+            ):
+                db.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_catalog_change
+                AFTER {event} ON {table}
+                {when}
+                BEGIN
+                  INSERT INTO catalog_changes (shop_id, entity, entity_id, op)
+                  VALUES ({row}.shop_id, '{entity}', {row}.id, '{op}');
+                END;
+                """)
+
+    @staticmethod
+    def latest_cursor(db, shop_id: int) -> int:
+        row = db.execute(
+            "SELECT MAX(id) AS cursor FROM catalog_changes WHERE shop_id = ?;",
+            (shop_id,),
+        ).fetchone()
+        # Never behind the pruned ids, or a client handed this cursor would be
+        # told to reset again on its next poll.
+        return max(row["cursor"] or 0, CatalogChange.pruned_through(db))
+
+    @staticmethod
+    def pruned_through(db) -> int:
+        """Highest change id no longer in the log (0 if nothing was pruned).
+
+        prune() only removes a prefix of ids, so every id below the oldest
+        remaining row is gone. Once the log is empty, that is every id ever
+        handed out, which sqlite_sequence still remembers.
+        """
+        oldest = db.execute("SELECT MIN(id) FROM catalog_changes;").fetchone()[0]
+        if oldest is not None:
+            return oldest - 1
+        row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'catalog_changes';").fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def since(db, shop_id: int, cursor: int, limit: int = 500):
+        """Rows changed after ``cursor``, collapsed to their current state.
+
+        Returns (changes, next_cursor, has_more), where changes maps each entity
+        name to {"upserts": [row dicts], "deleted": [ids]}.
+        """
+        log = db.execute("""
+            SELECT id, entity, entity_id, op
+            FROM catalog_changes
+            WHERE shop_id = ? AND id > ?
+            ORDER BY id
+            LIMIT ?;
+        """, (shop_id, cursor, limit)).fetchall()
+
+        last_op = {}
+        for row in log:
+            last_op[(row["entity"], row["entity_id"])] = row["op"]
+
+        changes = {}
+        for entity, (table, columns) in CHANGE_ENTITIES.items():
+            upsert_ids = [eid for (name, eid), op in last_op.items() if name == entity and op == "upsert"]
+            deleted = [eid for (name, eid), op in last_op.items() if name == entity and op == "delete"]
+            upserts = []
+            if upsert_ids:
+                placeholders = ", ".join("?" for _ in upsert_ids)
+                rows = db.execute(f"""
+                    SELECT {", ".join(columns)}
+                    FROM {table}
+                    WHERE shop_id = ? AND id IN ({placeholders})
+                    ORDER BY id;
+                """, (shop_id, *upsert_ids)).fetchall()
+                upserts = [dict(row) for row in rows]
+                found = {row["id"] for row in upserts}
+                # Deleted after the last change in this page; report it gone now.
+                deleted.extend(eid for eid in upsert_ids if eid not in found)
+            if upserts or deleted:
+                changes[entity] = {"upserts": upserts, "deleted": sorted(deleted)}
+
+        next_cursor = log[-1]["id"] if log else cursor
+        return changes, next_cursor, len(log) == limit
+
+    @staticmethod
+    def prune(db, keep_days: int) -> int:
+        # Up to the newest expired id, so what is left is always a suffix of the
+        # log, even if the clock stepped back (see pruned_through).
+        cursor = db.execute("""
+            DELETE FROM catalog_changes
+            WHERE id <= (SELECT MAX(id) FROM catalog_changes WHERE changed_at < datetime('now', ?));
+        """, (f"-{int(keep_days)} days",))
+        return cursor.rowcount
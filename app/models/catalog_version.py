@@ -0,0 +1,49 @@
+# Tables whose rows feed the cached catalog (see app/catalog_cache.py).
+CATALOG_TABLES = ("products", "brands", "categories", "stock_batches", "shop_settings")
+
+# Columns written on every sale. Readers of the cached catalog take them live
+# (Product.quantities), so updating only these leaves the version alone.
+UNVERSIONED_COLUMNS = {"products": ("quantity",)}
+
+
+class CatalogVersion:
+    @staticmethod
+    def create_table(db):
+        db.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_versions (
+          shop_id  INTEGER PRIMARY KEY,
+          version  INTEGER NOT NULL DEFAULT 0
+        );
+        """)
+
+        # Bump the shop's version on every catalog write, whichever process or
+        # script makes it, so cached copies in other workers notice the change.
+        # The UPDATE OF list is fixed when the trigger is created: a migration
+        # adding columns to such a table must recreate it (see migration 15).
+        for table in CATALOG_TABLES:
+            update = "UPDATE"
+            if table in UNVERSIONED_COLUMNS:
+                columns = [
+                    row[1] for row in db.execute(f"PRAGMA table_info({table});")
+                    if row[1] not in UNVERSIONED_COLUMNS[table]
+                ]
+                update = f"UPDATE OF {', '.join(columns)}"
+            for event, row in (("INSERT", "NEW"), (update, "NEW"), ("DELETE", "OLD")):
+                name = event.split()[0].lower()
+                db.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{name}_catalog_version
+                AFTER {event} ON {table}
+                BEGIN
+                  INSERT INTO catalog_versions (shop_id, version)
+                  VALUES ({row}.shop_id, 1)
+                  ON CONFLICT(shop_id) DO UPDATE SET version = version + 1;
+                END;
+                """)
+
+    @staticmethod
+    def current(db, shop_id: int) -> int:
+        row = db.execute(
+            "SELECT version FROM catalog_versions WHERE shop_id = ?;",
+            (shop_id,),
+        ).fetchone()
+        return row["version"] if row else 0
@@ -1,3 +1,49 @@
+import re
+
+# Ledger sort keys -> (SQL expression, tie-breaking id column). Every key but
+# name has its own customer_stats index; name uses the customers NOCASE index.
+LEDGER_SORTS = {
+    "name": ("c.name COLLATE NOCASE", "c.id"),
+    "item_count": ("cs.item_count", "cs.customer_id"),
+    "last_purchase": ("cs.last_purchase", "cs.customer_id"),
+    "sale_total": ("cs.sale_total", "cs.customer_id"),
+    "purchase_total": ("cs.purchase_total", "cs.customer_id"),
+    "profit_pct": ("cs.profit_pct", "cs.customer_id"),
+}
+
+
+def _like_prefix(text: str) -> str:
+    return re.sub(r"([\\%_])", r"\\\1", text) + "%"
+
+
+def _insight(row):
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "phone": row["phone"],
+        "item_count": row["item_count"],
+        "sale_total": row["sale_total"],
+        "purchase_total": row["purchase_total"],
+        "last_purchase": row["last_purchase"],
+        "profit_pct": row["profit_pct"],
+    }
+
+
+def _keyset(key: str, tie: str, ascending: bool, value, row_id: int):
+    """WHERE clause (and params) for rows after (value, row_id) in ORDER BY key, tie.
+
+    SQLite sorts NULLs first, so NULL stats (e.g. profit_pct with no purchase
+    cost) need their own branch.
+    """
+    op = ">" if ascending else "<"
+    if value is None:
+        if ascending:
+            return f"(({key} IS NULL AND {tie} > ?) OR {key} IS NOT NULL)", [row_id]
+        return f"({key} IS NULL AND {tie} < ?)", [row_id]
+    nulls = "" if ascending else f" OR {key} IS NULL"
+    return f"({key} {op} ? OR ({key} = ? AND {tie} {op} ?){nulls})", [value, value, row_id]
+
+
 class Customer:
     @staticmethod
     def create_table(db):
@@ -13,6 +59,17 @@ class Customer:
         );
         """)
 
+        # Digits-only copy of phone for typeahead ("0300-123" finds 0300123...).
+        try:
+            db.execute("ALTER TABLE customers ADD COLUMN phone_digits TEXT;")
+        except Exception:
+            pass
+
+    @staticmethod
+    def normalize_phone(phone) -> str | None:
+        digits = re.sub(r"\D", "", phone or "")
+        return digits or None
+
     @staticmethod
     def all_by_shop(db, shop_id: int):
         return db.execute("""
@@ -22,6 +79,91 @@ class Customer:
             ORDER BY name COLLATE NOCASE ASC;
         """, (shop_id,)).fetchall()
 
+    @staticmethod
+    def count(db, shop_id: int) -> int:
+        return db.execute("SELECT COUNT(*) FROM customers WHERE shop_id = ?;", (shop_id,)).fetchone()[0]
+
+    @staticmethod
+    def lookup(db, shop_id: int, query: str, limit: int = 20):
+        """Typeahead: customers whose name, or phone digits, start with ``query``.
+
+        Name matching is case-insensitive. Both branches are prefix range scans
+        on (shop_id, name COLLATE NOCASE) and (shop_id, phone_digits).
+        """
+        query = (query or "").strip()
+        if not query:
+            return db.execute("""
+                SELECT id, name, phone
+                FROM customers
+                WHERE shop_id = ?
+                ORDER BY name COLLATE NOCASE, id
+                LIMIT ?;
+            """, (shop_id, limit)).fetchall()
+
+        sql = "SELECT id, name, phone FROM customers WHERE shop_id = ? AND name LIKE ? ESCAPE '\\'"
+        params = [shop_id, _like_prefix(query)]
+        digits = Customer.normalize_phone(query)
+        if digits:
+            sql += " UNION SELECT id, name, phone FROM customers WHERE shop_id = ? AND phone_digits GLOB ?"
+            params += [shop_id, digits + "*"]
+        return db.execute(
+            f"{sql} ORDER BY name COLLATE NOCASE, id LIMIT ?;",
+            (*params, limit),
+        ).fetchall()
+
+    @staticmethod
+    def ledger_page(db, shop_id: int, *, sort: str = "name", descending: bool = False,
+                    after=None, before=None, search: str | None = None, limit: int = 25):
+        """One keyset page of per-customer purchase totals, read from customer_stats.
+
+        ``after`` / ``before`` are (sort value, customer id) pairs taken from the
+        last / first row of the neighbouring page. Returns (insights, has_prev,
+        has_next).
+        """
+        key, tie = LEDGER_SORTS[sort]
+        backwards = before is not None
+        cursor = before if backwards else after
+        # Walking backwards flips the comparison and order; rows are reversed after.
+        ascending = descending == backwards
+        direction = "ASC" if ascending else "DESC"
+
+        filters = ""
+        params = [shop_id]
+        search = (search or "").strip()
+        if search:
+            digits = Customer.normalize_phone(search)
+            filters += " AND (c.name LIKE ? ESCAPE '\\' OR c.phone_digits GLOB ?)"
+            params += [_like_prefix(search), (digits + "*") if digits else ""]
+        if cursor is not None:
+            clause, cursor_params = _keyset(key, tie, ascending, *cursor)
+            filters += f" AND {clause}"
+            params += cursor_params
+
+        # Drive the join from whichever table's index is already in page order.
+        if sort == "name":
+            tables = "customers c CROSS JOIN customer_stats cs"
+        else:
+            tables = "customer_stats cs CROSS JOIN customers c"
+        # Every customer with a recorded sale is listed, even one who has since
+        # returned it all. The unary + keeps that filter off any index, so the
+        # scan follows the index of the sort column.
+        rows = db.execute(f"""
+            SELECT c.id, c.name, c.phone,
+                   cs.item_count, cs.sale_total, cs.purchase_total,
+                   cs.last_purchase, cs.profit_pct
+            FROM {tables} ON cs.shop_id = c.shop_id AND cs.customer_id = c.id
+            WHERE c.shop_id = ? AND +cs.sale_count > 0 {filters}
+            ORDER BY {key} {direction}, {tie} {direction}
+            LIMIT ?;
+        """, (*params, limit + 1)).fetchall()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+            return [_insight(row) for row in rows], more, True
+        return [_insight(row) for row in rows], cursor is not None, more
+
     @staticmethod
     def get_for_shop(db, shop_id: int, customer_id: int):
         return db.execute("""
@@ -31,6 +173,18 @@ class Customer:
             LIMIT 1;
         """, (customer_id, shop_id)).fetchone()
 
+    @staticmethod
+    def existing_ids(db, shop_id: int, customer_ids):
+        ids = list(dict.fromkeys(customer_ids))
+        if not ids:
+            return set()
+        placeholders = ", ".join("?" for _ in ids)
+        rows = db.execute(f"""
+            SELECT id FROM customers
+            WHERE shop_id = ? AND id IN ({placeholders});
+        """, (shop_id, *ids)).fetchall()
+        return {row["id"] for row in rows}
+
     @staticmethod
     def get_by_name(db, shop_id: int, name: str):
         return db.execute("""
@@ -43,9 +197,9 @@ class Customer:
     @staticmethod
     def create(db, shop_id: int, name: str, phone: str | None = None):
         cursor = db.execute("""
-            INSERT INTO customers (shop_id, name, phone)
-            VALUES (?, ?, ?);
-        """, (shop_id, name.strip(), phone.strip() if phone else None))
+            INSERT INTO customers (shop_id, name, phone, phone_digits)
+            VALUES (?, ?, ?, ?);
+        """, (shop_id, name.strip(), phone.strip() if phone else None, Customer.normalize_phone(phone)))
         return cursor.lastrowid
 
     @staticmethod
@@ -0,0 +1,110 @@
+import sqlite3
+
+
+class CustomerStats:
+    @staticmethod
+    def create_table(db):
+        # Net of returns. profit_pct is derived, but stored in the index so the
+        # ledger can page through it like any other stat.
+        db.execute("""
+        CREATE TABLE IF NOT EXISTS customer_stats (
+          shop_id         INTEGER NOT NULL,
+          customer_id     INTEGER NOT NULL,
+          item_count      INTEGER NOT NULL DEFAULT 0,
+          sale_total      REAL NOT NULL DEFAULT 0,
+          purchase_total  REAL NOT NULL DEFAULT 0,
+          last_purchase   TEXT,
+          sale_count      INTEGER NOT NULL DEFAULT 0,
+          profit_pct      REAL GENERATED ALWAYS AS (
+            CASE WHEN purchase_total > 0
+                 THEN ((sale_total - purchase_total) / purchase_total) * 100
+            END
+          ) VIRTUAL,
+          PRIMARY KEY (shop_id, customer_id),
+          FOREIGN KEY (shop_id)     REFERENCES shops(id) ON DELETE CASCADE,
+          FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
+        );
+        """)
+        # Sales (not returns) recorded for the customer; backfilled by migration 18.
+        try:
+            db.execute("ALTER TABLE customer_stats ADD COLUMN sale_count INTEGER NOT NULL DEFAULT 0;")
+        except sqlite3.OperationalError:
+            pass
+        # Customer.ledger_page: one index per sortable stat, already in page order.
+        for column in ("item_count", "sale_total", "purchase_total", "last_purchase", "profit_pct"):
+            db.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_customer_stats_shop_{column} "
+                f"ON customer_stats(shop_id, {column}, customer_id);"
+            )
+
+    @staticmethod
+    def apply_sale(db, sale_id: int, sale_type: str):
+        # Called by Sale.record inside the same transaction as the sale insert.
+        # A return takes its items back off the customer's totals; only sales
+        # move last_purchase.
+        sign = 1 if sale_type == "sale" else -1
+        db.execute("""
+            INSERT INTO customer_stats (
+              shop_id, customer_id, item_count, sale_total, purchase_total, last_purchase, sale_count
+            )
+            SELECT s.shop_id,
+                   s.customer_id,
+                   ? * SUM(si.quantity),
+                   ? * SUM(si.quantity * si.unit_price),
+                   ? * SUM(si.quantity * COALESCE(si.unit_cost, 0)),
+                   CASE WHEN s.sale_type = 'sale' THEN s.created_at END,
+                   CASE WHEN s.sale_type = 'sale' THEN 1 ELSE 0 END
+            FROM sales s
+            JOIN sale_items si ON si.sale_id = s.id
+            WHERE s.id = ? AND s.customer_id IS NOT NULL
+            GROUP BY s.id
+            ON CONFLICT(shop_id, customer_id) DO UPDATE SET
+              item_count     = item_count + excluded.item_count,
+              sale_total     = sale_total + excluded.sale_total,
+              purchase_total = purchase_total + excluded.purchase_total,
+              sale_count     = sale_count + excluded.sale_count,
+              last_purchase  = COALESCE(
+                MAX(last_purchase, excluded.last_purchase),
+                last_purchase,
+                excluded.last_purchase
+              );
+        """, (sign, sign, sign, sale_id))
+
+    @staticmethod
+    def get(db, shop_id: int, customer_id: int):
+        return db.execute("""
+            SELECT item_count, sale_total, purchase_total, last_purchase, profit_pct
+            FROM customer_stats
+            WHERE shop_id = ? AND customer_id = ?;
+        """, (shop_id, customer_id)).fetchone()
+
+    @staticmethod
+    def rebuild(db, shop_id: int | None = None):
+        scope = "" if shop_id is None else "WHERE s.shop_id = ?"
+        params = () if shop_id is None else (shop_id,)
+        if shop_id is None:
+            db.execute("DELETE FROM customer_stats;")
+        else:
+            db.execute("DELETE FROM customer_stats WHERE shop_id = ?;", params)
+        db.execute(f"""
+            INSERT INTO customer_stats (
+              shop_id, customer_id, item_count, sale_total, purchase_total, last_purchase, sale_count
+            )
+            SELECT shop_id,
+                   customer_id,
+                   SUM(sign * quantity),
+                   SUM(sign * quantity * unit_price),
+                   SUM(sign * quantity * unit_cost),
+                   MAX(CASE WHEN sign = 1 THEN created_at END),
+                   COUNT(DISTINCT CASE WHEN sign = 1 THEN sale_id END)
+            FROM (
+              SELECT s.shop_id, s.customer_id, s.created_at, s.id AS sale_id,
+                     CASE WHEN s.sale_type = 'sale' THEN 1 ELSE -1 END AS sign,
+                     si.quantity, si.unit_price, COALESCE(si.unit_cost, 0) AS unit_cost
+              FROM sales s
+              JOIN customers c ON c.id = s.customer_id AND c.shop_id = s.shop_id
+              JOIN sale_items si ON si.sale_id = s.id
+              {scope}
+            )
+            GROUP BY shop_id, customer_id;
+        """, params)
@@ -0,0 +1,88 @@
+class DailySalesRollup:
+    @staticmethod
+    def create_table(db):
+        db.execute("""
+        CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+          shop_id         INTEGER NOT NULL,
+          sale_date       TEXT NOT NULL,
+          sales_total     REAL NOT NULL DEFAULT 0,
+          returns_total   REAL NOT NULL DEFAULT 0,
+          sale_count      INTEGER NOT NULL DEFAULT 0,
+          return_count    INTEGER NOT NULL DEFAULT 0,
+          sold_items      INTEGER NOT NULL DEFAULT 0,
+          returned_items  INTEGER NOT NULL DEFAULT 0,
+          PRIMARY KEY (shop_id, sale_date),
+          FOREIGN KEY (shop_id) REFERENCES shops(id) ON DELETE CASCADE
+        );
+        """)
+
+    @staticmethod
+    def apply_sale(db, sale_id: int, sale_type: str, total_amount: float, item_quantity: int):
+        # Called by Sale.record inside the same transaction as the sale insert.
+        is_sale = sale_type == "sale"
+        db.execute("""
+            INSERT INTO daily_sales_rollup (
+              shop_id, sale_date, sales_total, returns_total,
+              sale_count, return_count, sold_items, returned_items
+            )
+            SELECT shop_id, sale_date, ?, ?, ?, ?, ?, ?
+            FROM sales
+            WHERE id = ?
+            ON CONFLICT(shop_id, sale_date) DO UPDATE SET
+              sales_total    = sales_total + excluded.sales_total,
+              returns_total  = returns_total + excluded.returns_total,
+              sale_count     = sale_count + excluded.sale_count,
+              return_count   = return_count + excluded.return_count,
+              sold_items     = sold_items + excluded.sold_items,
+              returned_items = returned_items + excluded.returned_items;
+        """, (
+            total_amount if is_sale else 0.0,
+            0.0 if is_sale else total_amount,
+            1 if is_sale else 0,
+            0 if is_sale else 1,
+            item_quantity if is_sale else 0,
+            0 if is_sale else item_quantity,
+            sale_id,
+        ))
+
+    @staticmethod
+    def between(db, shop_id: int, start_date: str, end_date: str):
+        return db.execute("""
+            SELECT sale_date, sales_total, returns_total, sale_count,
+                   return_count, sold_items, returned_items
+            FROM daily_sales_rollup
+            WHERE shop_id = ?
+              AND sale_date BETWEEN date(?) AND date(?)
+            ORDER BY sale_date DESC;
+        """, (shop_id, start_date, end_date)).fetchall()
+
+    @staticmethod
+    def rebuild(db, shop_id: int | None = None):
+        scope = "" if shop_id is None else "WHERE s.shop_id = ?"
+        params = () if shop_id is None else (shop_id,)
+        if shop_id is None:
+            db.execute("DELETE FROM daily_sales_rollup;")
+        else:
+            db.execute("DELETE FROM daily_sales_rollup WHERE shop_id = ?;", params)
+        db.execute(f"""
+            INSERT INTO daily_sales_rollup (
+              shop_id, sale_date, sales_total, returns_total,
+              sale_count, return_count, sold_items, returned_items
+            )
+            SELECT shop_id,
+                   sale_date,
+                   SUM(CASE WHEN sale_type = 'sale' THEN total_amount ELSE 0 END),
+                   SUM(CASE WHEN sale_type = 'return' THEN total_amount ELSE 0 END),
+                   SUM(CASE WHEN sale_type = 'sale' THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN sale_type = 'return' THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN sale_type = 'sale' THEN item_count ELSE 0 END),
+                   SUM(CASE WHEN sale_type = 'return' THEN item_count ELSE 0 END)
+            FROM (
+              SELECT s.shop_id, s.sale_date, s.sale_type, s.total_amount,
+                     COALESCE((SELECT SUM(si.quantity) FROM sale_items si WHERE si.sale_id = s.id), 0) AS item_count
+              FROM sales s
+              {scope}
+            )
+            WHERE sale_date IS NOT NULL
+            GROUP BY shop_id, sale_date;
+        """, params)
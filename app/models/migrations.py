@@ -0,0 +1,250 @@
+from .shop_settings import DEFAULT_UTC_OFFSET_MINUTES
+from .daily_sales_rollup import DailySalesRollup
+from .restock_rollup import RestockRollup
+from .product_search import ProductSearch
+from .catalog_change import CatalogChange
+from .customer import Customer
+from .customer_stats import CustomerStats
+from .product import Product
+from .product_sales_stats import ProductSalesStats
+from .sale import SALE_ITEMS_COLUMNS
+from .catalog_version import CatalogVersion
+
+
+def _hot_path_indexes(db):
+    for sql in [
+        # Sale.recent_with_items / report ranges: newest sales of one shop.
+        "CREATE INDEX IF NOT EXISTS ix_sales_shop_created ON sales(shop_id, created_at);",
+        # Customer insights: a customer's sales of one type.
+        "CREATE INDEX IF NOT EXISTS ix_sales_shop_customer_type ON sales(shop_id, customer_id, sale_type);",
+        "CREATE INDEX IF NOT EXISTS ix_sale_items_sale ON sale_items(sale_id);",
+        "CREATE INDEX IF NOT EXISTS ix_sale_items_product ON sale_items(product_id);",
+        # StockBatch.by_product / latest_for_product, already in display order.
+        "CREATE INDEX IF NOT EXISTS ix_stock_batches_shop_product_date "
+        "ON stock_batches(shop_id, product_id, batch_date, created_at);",
+        # StockBatch.by_date / summary_by_date.
+        "CREATE INDEX IF NOT EXISTS ix_stock_batches_shop_date ON stock_batches(shop_id, batch_date, created_at);",
+        "CREATE INDEX IF NOT EXISTS ix_products_shop_brand ON products(shop_id, brand_id);",
+        "CREATE INDEX IF NOT EXISTS ix_products_shop_category ON products(shop_id, category_id);",
+    ]:
+        db.execute(sql)
+    db.execute("ANALYZE;")
+
+
+def _local_sale_dates(db):
+    db.execute(f"""
+        UPDATE sales
+        SET sale_date = date(
+          created_at,
+          COALESCE(
+            (SELECT ss.utc_offset_minutes FROM shop_settings ss WHERE ss.shop_id = sales.shop_id),
+            {DEFAULT_UTC_OFFSET_MINUTES}
+          ) || ' minutes'
+        )
+        WHERE sale_date IS NULL;
+    """)
+    # Report ranges on the business date, already in display order.
+    db.execute("CREATE INDEX IF NOT EXISTS ix_sales_shop_sale_date ON sales(shop_id, sale_date, created_at);")
+
+
+def _daily_sales_rollup(db):
+    DailySalesRollup.rebuild(db)
+
+
+def _sale_client_keys(db):
+    # A till retrying a sync must never record the same sale twice.
+    db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_sales_shop_client_key "
+        "ON sales(shop_id, client_key) WHERE client_key IS NOT NULL;"
+    )
+
+
+def _product_search_backfill(db):
+    # The triggers only index products written after the table appeared.
+    ProductSearch.rebuild(db)
+
+
+def _product_codes(db):
+    # Scan lookups (Product.by_code) and duplicate-code checks in one index.
+    db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_products_shop_code "
+        "ON products(shop_id, code) WHERE code IS NOT NULL;"
+    )
+    # Recreate the change-log trigger so it also watches the new column.
+    db.execute("DROP TRIGGER IF EXISTS trg_products_update_catalog_change;")
+    CatalogChange.create_table(db)
+
+
+def _customer_typeahead(db):
+    rows = db.execute("SELECT id, phone FROM customers WHERE phone IS NOT NULL;").fetchall()
+    db.executemany(
+        "UPDATE customers SET phone_digits = ? WHERE id = ?;",
+        [(Customer.normalize_phone(phone), customer_id) for customer_id, phone in rows],
+    )
+    # Customer.lookup: prefix range scans on name (any case) and phone digits.
+    db.execute("CREATE INDEX IF NOT EXISTS ix_customers_shop_name_nocase ON customers(shop_id, name COLLATE NOCASE);")
+    db.execute("CREATE INDEX IF NOT EXISTS ix_customers_shop_phone_digits ON customers(shop_id, phone_digits);")
+
+
+def _customer_stats(db):
+    # Seed the ledger table from the sales recorded before it existed.
+    CustomerStats.rebuild(db)
+
+
+def _batch_rate(order: str, date_filter: str) -> str:
+    return f"""
+      SELECT sb.purchase_rate
+      FROM sales s
+      JOIN stock_batches sb ON sb.shop_id = s.shop_id AND sb.product_id = sale_items.product_id
+      WHERE s.id = sale_items.sale_id {date_filter}
+      ORDER BY sb.batch_date {order}, sb.created_at {order}, sb.id {order}
+      LIMIT 1
+    """
+
+
+def _sale_item_costs(db):
+    # Best effort for lines recorded before unit_cost existed: the last restock
+    # on or before the sale's business date, else the first one after it.
+    db.execute(f"""
+        UPDATE sale_items
+        SET unit_cost = COALESCE(
+          ({_batch_rate("DESC", "AND sb.batch_date <= COALESCE(s.sale_date, date(s.created_at))")}),
+          ({_batch_rate("ASC", "")})
+        )
+        WHERE unit_cost IS NULL;
+    """)
+    # Lines returned against a sale are costed like the line they came from.
+    db.execute("""
+        UPDATE sale_items
+        SET unit_cost = COALESCE((
+          SELECT sold.unit_cost
+          FROM sales r
+          JOIN sale_items sold ON sold.sale_id = r.reference_sale_id
+                              AND sold.product_id = sale_items.product_id
+          WHERE r.id = sale_items.sale_id
+          ORDER BY sold.id
+          LIMIT 1
+        ), unit_cost)
+        WHERE sale_id IN (SELECT id FROM sales WHERE sale_type = 'return' AND reference_sale_id IS NOT NULL);
+    """)
+    CustomerStats.rebuild(db)
+
+
+def _product_last_restock(db):
+    Product.rebuild_last_restock(db)
+
+
+def _sales_journal_index(db):
+    # Sale.journal_page filtered by type, already in page order.
+    db.execute("CREATE INDEX IF NOT EXISTS ix_sales_shop_type_created ON sales(shop_id, sale_type, created_at);")
+
+
+def _product_sales_stats(db):
+    # Seed the per-product totals from the sales recorded before they existed.
+    ProductSalesStats.rebuild(db)
+
+
+def _customer_history_index(db):
+    # Sale.journal_page for one customer, already in page order. It also covers
+    # every (shop_id, customer_id) lookup the old per-type index served.
+    db.execute("CREATE INDEX IF NOT EXISTS ix_sales_shop_customer_created ON sales(shop_id, customer_id, created_at);")
+    db.execute("DROP INDEX IF EXISTS ix_sales_shop_customer_type;")
+    db.execute("ANALYZE sales;")
+
+
+def _sale_item_product_names(db):
+    db.execute("""
+        UPDATE sale_items
+        SET product_name = (SELECT p.name FROM products p WHERE p.id = sale_items.product_id)
+        WHERE product_name IS NULL;
+    """)
+    # Older tables cascade product deletes into sale_items. SQLite cannot drop
+    # a foreign key in place, so copy the lines into a table without it.
+    if not any(fk[2] == "products" for fk in db.execute("PRAGMA foreign_key_list(sale_items);")):
+        return
+    columns = (
+        "id, sale_id, product_id, quantity, unit_price, returned_quantity, "
+        "returned_at, unit_cost, product_name"
+    )
+    seq = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'sale_items';").fetchone()
+    db.execute(f"CREATE TABLE sale_items_rebuild ({SALE_ITEMS_COLUMNS});")
+    db.execute(f"INSERT INTO sale_items_rebuild ({columns}) SELECT {columns} FROM sale_items;")
+    db.execute("DROP TABLE sale_items;")
+    db.execute("ALTER TABLE sale_items_rebuild RENAME TO sale_items;")
+    if seq is not None:
+        # Keep ids of lines deleted from the end of the table from being reused.
+        db.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'sale_items';", (seq[0],))
+    db.execute("CREATE INDEX IF NOT EXISTS ix_sale_items_sale ON sale_items(sale_id);")
+    db.execute("CREATE INDEX IF NOT EXISTS ix_sale_items_product ON sale_items(product_id);")
+    db.execute("ANALYZE sale_items;")
+
+
+def _unversioned_stock(db):
+    # Sales only move products.quantity; stop that bumping the catalog version.
+    db.execute("DROP TRIGGER IF EXISTS trg_products_update_catalog_version;")
+    CatalogVersion.create_table(db)
+    # Product.quantities / stock_overview: the live stock read on every page.
+    db.execute(
+        "CREATE INDEX IF NOT EXISTS ix_products_shop_stock ON products(shop_id, quantity, reorder_level);"
+    )
+
+
+def _sale_item_sale_times(db):
+    db.execute("""
+        UPDATE sale_items
+        SET sale_created_at = (SELECT s.created_at FROM sales s WHERE s.id = sale_items.sale_id)
+        WHERE sale_created_at IS NULL;
+    """)
+    # Sale.journal_page with a product filter: that product's sales, newest first.
+    db.execute(
+        "CREATE INDEX IF NOT EXISTS ix_sale_items_product_created "
+        "ON sale_items(product_id, sale_created_at, sale_id);"
+    )
+    db.execute("ANALYZE sale_items;")
+
+
+def _restock_rollup(db):
+    RestockRollup.rebuild(db)
+
+
+def _customer_sale_counts(db):
+    # Fill customer_stats.sale_count for customers recorded before it existed.
+    CustomerStats.rebuild(db)
+
+
+# (version, step) pairs, applied in order. Append new steps; never renumber.
+MIGRATIONS = [
+    (1, _hot_path_indexes),
+    (2, _local_sale_dates),
+    (3, _daily_sales_rollup),
+    (4, _sale_client_keys),
+    (5, _product_search_backfill),
+    (6, _product_codes),
+    (7, _customer_typeahead),
+    (8, _customer_stats),
+    (9, _sale_item_costs),
+    (10, _product_last_restock),
+    (11, _sales_journal_index),
+    (12, _product_sales_stats),
+    (13, _customer_history_index),
+    (14, _sale_item_product_names),
+    (15, _unversioned_stock),
+    (16, _sale_item_sale_times),
+    (17, _restock_rollup),
+    (18, _customer_sale_counts),
+]
+
+
+def schema_version(db):
+    return db.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def apply_migrations(db):
+    current = schema_version(db)
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        step(db)
+        db.execute(f"PRAGMA user_version = {int(version)};")
+        current = version
+    return current
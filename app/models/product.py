@@ -1,3 +1,10 @@
+# Stay well under SQLITE_MAX_VARIABLE_NUMBER (999 on older builds).
+ID_LOOKUP_CHUNK = 400
+
+# Longest barcode / SKU code accepted.
+CODE_MAX_LENGTH = 64
+
+
 class Product:
     @staticmethod
     def create_table(db):
@@ -25,6 +32,13 @@ class Product:
             "ALTER TABLE products ADD COLUMN price REAL NOT NULL DEFAULT 0;",
             "ALTER TABLE products ADD COLUMN quantity INTEGER NOT NULL DEFAULT 0;",
             "ALTER TABLE products ADD COLUMN reorder_level INTEGER NOT NULL DEFAULT 3;",
+            # Barcode / SKU; unique per shop once set (see migrations).
+            "ALTER TABLE products ADD COLUMN code TEXT;",
+            # Copy of the latest restock (by batch date), kept current by a
+            # stock_batches trigger; NULL until the first restock.
+            "ALTER TABLE products ADD COLUMN last_purchase_rate REAL;",
+            "ALTER TABLE products ADD COLUMN last_sale_price REAL;",
+            "ALTER TABLE products ADD COLUMN last_restock_date TEXT;",
         ]:
             try:
                 db.execute(sql)
@@ -32,34 +46,25 @@ class Product:
                 pass
 
     @staticmethod
-    def create(db, shop_id: int, name: str, price: float, brand_id=None, category_id=None, reorder_level: int = 3):
+    def normalize_code(raw) -> str | None:
+        """Scanned or typed code as stored: trimmed, or None when blank."""
+        code = (raw or "").strip()
+        return code or None
+
+    @staticmethod
+    def create(db, shop_id: int, name: str, price: float, brand_id=None, category_id=None, reorder_level: int = 3, code: str | None = None):
         db.execute("""
-            INSERT INTO products (shop_id, brand_id, category_id, name, price, reorder_level)
-            VALUES (?, ?, ?, ?, ?, ?);
-        """, (shop_id, brand_id, category_id, name.strip(), price, reorder_level))
+            INSERT INTO products (shop_id, brand_id, category_id, name, price, reorder_level, code)
+            VALUES (?, ?, ?, ?, ?, ?, ?);
+        """, (shop_id, brand_id, category_id, name.strip(), price, reorder_level, Product.normalize_code(code)))
 
     @staticmethod
-    def update(db, shop_id: int, product_id: int, *, name: str, price: float, brand_id=None, category_id=None, reorder_level: int | None = None):
+    def update(db, shop_id: int, product_id: int, *, name: str, price: float, brand_id=None, category_id=None, reorder_level: int | None = None, code: str | None = None):
         db.execute("""
             UPDATE products
-            SET name=?, price=?, brand_id=?, category_id=?, reorder_level=COALESCE(?, reorder_level)
+            SET name=?, price=?, brand_id=?, category_id=?, reorder_level=COALESCE(?, reorder_level), code=?
             WHERE id=? AND shop_id=?;
-        """, (name.strip(), price, brand_id, category_id, reorder_level, product_id, shop_id))
-
-    @staticmethod
-    def add_stock(db, product_id: int, quantity: int, price: float | None = None):
-        if price is not None:
-            db.execute("""
-                UPDATE products
-                SET quantity = quantity + ?, price=?
-                WHERE id = ?;
-            """, (quantity, price, product_id))
-        else:
-            db.execute("""
-                UPDATE products
-                SET quantity = quantity + ?
-                WHERE id = ?;
-            """, (quantity, product_id))
+        """, (name.strip(), price, brand_id, category_id, reorder_level, Product.normalize_code(code), product_id, shop_id))
 
     @staticmethod
     def all_by_shop(db, shop_id: int):
@@ -72,6 +77,42 @@ class Product:
             ORDER BY p.id DESC;
         """, (shop_id,)).fetchall()
 
+    @staticmethod
+    def quantities(db, shop_id: int):
+        """{product_id: quantity} for the shop, read from ix_products_shop_stock alone."""
+        rows = db.execute("SELECT id, quantity FROM products WHERE shop_id = ?;", (shop_id,)).fetchall()
+        return {row["id"]: row["quantity"] for row in rows}
+
+    @staticmethod
+    def stock_overview(db, shop_id: int):
+        return db.execute("""
+            SELECT COUNT(*) AS total_products,
+                   COALESCE(SUM(quantity), 0) AS total_stock,
+                   COALESCE(SUM(CASE WHEN quantity <= COALESCE(reorder_level, 0) THEN 1 ELSE 0 END), 0) AS out_of_stock
+            FROM products
+            WHERE shop_id = ?;
+        """, (shop_id,)).fetchone()
+
+    @staticmethod
+    def counts_by_brand(db, shop_id: int):
+        rows = db.execute("""
+            SELECT brand_id, COUNT(*) AS product_count
+            FROM products
+            WHERE shop_id = ? AND brand_id IS NOT NULL
+            GROUP BY brand_id;
+        """, (shop_id,)).fetchall()
+        return {row["brand_id"]: row["product_count"] for row in rows}
+
+    @staticmethod
+    def counts_by_category(db, shop_id: int):
+        rows = db.execute("""
+            SELECT category_id, COUNT(*) AS product_count
+            FROM products
+            WHERE shop_id = ? AND category_id IS NOT NULL
+            GROUP BY category_id;
+        """, (shop_id,)).fetchall()
+        return {row["category_id"]: row["product_count"] for row in rows}
+
     @staticmethod
     def get_for_shop(db, shop_id: int, product_id: int):
         return db.execute("""
@@ -83,6 +124,89 @@ class Product:
             LIMIT 1;
         """, (shop_id, product_id)).fetchone()
 
+    @staticmethod
+    def many_for_shop(db, shop_id: int, product_ids):
+        ids = list(dict.fromkeys(product_ids))
+        found = {}
+        for start in range(0, len(ids), ID_LOOKUP_CHUNK):
+            chunk = ids[start:start + ID_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = db.execute(f"""
+                SELECT id, name, price, quantity, reorder_level,
+                       last_purchase_rate, last_restock_date
+                FROM products
+                WHERE shop_id = ? AND id IN ({placeholders});
+            """, (shop_id, *chunk)).fetchall()
+            found.update((row["id"], row) for row in rows)
+        return found
+
+    @staticmethod
+    def by_code(db, shop_id: int, code: str):
+        """Scan lookup: the product, its stock and default sale price, in one query.
+
+        A single ux_products_shop_code lookup; the cost does not grow with the
+        catalog or its restock history.
+        """
+        return db.execute("""
+            SELECT p.id, p.name, p.code, p.price, p.quantity, p.reorder_level,
+                   c.name AS category_name,
+                   p.last_purchase_rate AS purchase_rate,
+                   p.last_sale_price AS latest_sale_price,
+                   COALESCE(p.last_sale_price, p.price) AS default_sale_price
+            FROM products p
+            LEFT JOIN categories c ON c.id = p.category_id
+            WHERE p.shop_id = ? AND p.code = ?;
+        """, (shop_id, Product.normalize_code(code))).fetchone()
+
+    @staticmethod
+    def last_purchase_rates(db, shop_id: int, product_ids):
+        """{product_id: latest restock purchase rate}, for products restocked at least once."""
+        ids = list(dict.fromkeys(product_ids))
+        rates = {}
+        for start in range(0, len(ids), ID_LOOKUP_CHUNK):
+            chunk = ids[start:start + ID_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = db.execute(f"""
+                SELECT id, last_purchase_rate
+                FROM products
+                WHERE shop_id = ? AND id IN ({placeholders}) AND last_restock_date IS NOT NULL;
+            """, (shop_id, *chunk)).fetchall()
+            rates.update((row["id"], row["last_purchase_rate"]) for row in rows)
+        return rates
+
+    @staticmethod
+    def rebuild_last_restock(db, shop_id: int | None = None):
+        """Recompute last_purchase_rate / last_sale_price / last_restock_date from stock_batches."""
+        scope = "" if shop_id is None else "WHERE shop_id = ?"
+        params = () if shop_id is None else (shop_id,)
+        db.execute(f"""
+            UPDATE products
+            SET (last_purchase_rate, last_sale_price, last_restock_date) = (
+              SELECT sb.purchase_rate, sb.sale_price, sb.batch_date
+              FROM stock_batches sb
+              WHERE sb.shop_id = products.shop_id AND sb.product_id = products.id
+              ORDER BY sb.batch_date DESC, sb.created_at DESC, sb.id DESC
+              LIMIT 1
+            )
+            {scope};
+        """, params)
+
+    @staticmethod
+    def ids_for_codes(db, shop_id: int, codes):
+        """{code: product_id} for the codes that exist in the shop."""
+        wanted = list(dict.fromkeys(code for code in map(Product.normalize_code, codes) if code))
+        found = {}
+        for start in range(0, len(wanted), ID_LOOKUP_CHUNK):
+            chunk = wanted[start:start + ID_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = db.execute(f"""
+                SELECT id, code
+                FROM products
+                WHERE shop_id = ? AND code IN ({placeholders});
+            """, (shop_id, *chunk)).fetchall()
+            found.update((row["code"], row["id"]) for row in rows)
+        return found
+
     @staticmethod
     def delete(db, shop_id: int, product_id: int):
         db.execute("""
@@ -91,9 +215,54 @@ class Product:
         """, (product_id, shop_id))
 
     @staticmethod
-    def adjust_quantity(db, shop_id: int, product_id: int, delta: int):
-        db.execute("""
-            UPDATE products
-            SET quantity = quantity + ?
-            WHERE id=? AND shop_id=?;
-        """, (delta, product_id, shop_id))
+    def reserve_stock(db, shop_id: int, quantities: dict) -> list[int]:
+        """Take {product_id: quantity} out of stock where enough is on hand.
+
+        The check and the decrement are one statement, so concurrent sales
+        cannot both take the last units. Returns the ids of products that were
+        short; if there are any, the caller must roll back, since the other
+        lines have already been decremented.
+        """
+        items = list(quantities.items())
+        reserved = set()
+        for start in range(0, len(items), ID_LOOKUP_CHUNK // 4):
+            chunk = items[start:start + ID_LOOKUP_CHUNK // 4]
+            cases = " ".join("WHEN ? THEN ?" for _ in chunk)
+            case_params = tuple(value for pid, qty in chunk for value in (pid, qty))
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = db.execute(f"""
+                UPDATE products
+                SET quantity = quantity - CASE id {cases} END
+                WHERE shop_id = ? AND id IN ({placeholders})
+                  AND quantity >= CASE id {cases} END
+                RETURNING id;
+            """, (*case_params, shop_id, *(pid for pid, _ in chunk), *case_params)).fetchall()
+            reserved.update(row["id"] for row in rows)
+        return [pid for pid, _ in items if pid not in reserved]
+
+    @staticmethod
+    def adjust_quantities(db, shop_id: int, deltas: dict, prices: dict | None = None):
+        # One UPDATE per chunk for a whole invoice: {product_id: delta}, and
+        # optionally {product_id: new price} for restocks. Kept a plain UPDATE
+        # (no CTE) so sqlite3 opens the implicit transaction before it runs.
+        prices = prices or {}
+        items = list(deltas.items())
+        for start in range(0, len(items), ID_LOOKUP_CHUNK // 4):
+            chunk = items[start:start + ID_LOOKUP_CHUNK // 4]
+            delta_cases = " ".join("WHEN ? THEN ?" for _ in chunk)
+            placeholders = ", ".join("?" for _ in chunk)
+            params = [value for pid, delta in chunk for value in (pid, delta)]
+            # Only name price when this chunk sets one: the catalog version
+            # trigger fires on UPDATE OF price even if the value is unchanged,
+            # and a sale or return must leave the cached catalog alone.
+            priced = [(pid, prices[pid]) for pid, _ in chunk if pid in prices]
+            price_set = ""
+            if priced:
+                price_cases = " ".join("WHEN ? THEN ?" for _ in priced)
+                price_set = f", price = COALESCE(CASE id {price_cases} END, price)"
+                params += [value for pid, price in priced for value in (pid, price)]
+            db.execute(f"""
+                UPDATE products
+                SET quantity = quantity + CASE id {delta_cases} END{price_set}
+                WHERE shop_id = ? AND id IN ({placeholders});
+            """, (*params, shop_id, *(pid for pid, _ in chunk)))
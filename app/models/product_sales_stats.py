@@ -0,0 +1,73 @@
+_TOTALS = """
+  SUM(CASE WHEN s.sale_type = 'sale' THEN si.quantity ELSE 0 END),
+  SUM(CASE WHEN s.sale_type = 'return' THEN si.quantity ELSE 0 END),
+  SUM(CASE WHEN s.sale_type = 'sale' THEN si.quantity * si.unit_price ELSE 0 END),
+  SUM(CASE WHEN s.sale_type = 'return' THEN si.quantity * si.unit_price ELSE 0 END)
+"""
+
+
+class ProductSalesStats:
+    @staticmethod
+    def create_table(db):
+        db.execute("""
+        CREATE TABLE IF NOT EXISTS product_sales_stats (
+          shop_id            INTEGER NOT NULL,
+          product_id         INTEGER NOT NULL,
+          sold_quantity      INTEGER NOT NULL DEFAULT 0,
+          returned_quantity  INTEGER NOT NULL DEFAULT 0,
+          sales_total        REAL NOT NULL DEFAULT 0,
+          returns_total      REAL NOT NULL DEFAULT 0,
+          PRIMARY KEY (shop_id, product_id),
+          FOREIGN KEY (shop_id)    REFERENCES shops(id) ON DELETE CASCADE,
+          FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        );
+        """)
+
+    @staticmethod
+    def apply_sale(db, sale_id: int):
+        # Called by Sale.record inside the same transaction as the sale insert.
+        # A return of a since-deleted product has no stats row to update.
+        db.execute(f"""
+            INSERT INTO product_sales_stats (
+              shop_id, product_id, sold_quantity, returned_quantity, sales_total, returns_total
+            )
+            SELECT s.shop_id, si.product_id, {_TOTALS}
+            FROM sales s
+            JOIN sale_items si ON si.sale_id = s.id
+            JOIN products p ON p.id = si.product_id
+            WHERE s.id = ?
+            GROUP BY si.product_id
+            ON CONFLICT(shop_id, product_id) DO UPDATE SET
+              sold_quantity     = sold_quantity + excluded.sold_quantity,
+              returned_quantity = returned_quantity + excluded.returned_quantity,
+              sales_total       = sales_total + excluded.sales_total,
+              returns_total     = returns_total + excluded.returns_total;
+        """, (sale_id,))
+
+    @staticmethod
+    def get(db, shop_id: int, product_id: int):
+        return db.execute("""
+            SELECT sold_quantity, returned_quantity, sales_total, returns_total
+            FROM product_sales_stats
+            WHERE shop_id = ? AND product_id = ?;
+        """, (shop_id, product_id)).fetchone()
+
+    @staticmethod
+    def rebuild(db, shop_id: int | None = None):
+        scope = "" if shop_id is None else "WHERE s.shop_id = ?"
+        params = () if shop_id is None else (shop_id,)
+        if shop_id is None:
+            db.execute("DELETE FROM product_sales_stats;")
+        else:
+            db.execute("DELETE FROM product_sales_stats WHERE shop_id = ?;", params)
+        db.execute(f"""
+            INSERT INTO product_sales_stats (
+              shop_id, product_id, sold_quantity, returned_quantity, sales_total, returns_total
+            )
+            SELECT s.shop_id, si.product_id, {_TOTALS}
+            FROM sales s
+            JOIN sale_items si ON si.sale_id = s.id
+            JOIN products p ON p.id = si.product_id
+            {scope}
+            GROUP BY s.shop_id, si.product_id;
+        """, params)
@@ -0,0 +1,183 @@
+import re
+import sqlite3
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_INDEXED_ROW = """
+  SELECT p.id, p.shop_id, p.name,
+         (SELECT b.name FROM brands b WHERE b.id = p.brand_id),
+         (SELECT c.name FROM categories c WHERE c.id = p.category_id)
+  FROM products p
+"""
+
+
+class ProductSearch:
+    @staticmethod
+    def create_table(db):
+        # rowid = products.id. Only name/brand/category are indexed, so the
+        # quantity and price updates of every sale never touch the index.
+        try:
+            db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+              name, brand_name, category_name, shop_id UNINDEXED,
+              tokenize = 'unicode61 remove_diacritics 2',
+              prefix = '2 3'
+            );
+            """)
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search() falls back to LIKE.
+            return
+
+        for sql in [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_products_insert_search
+            AFTER INSERT ON products
+            BEGIN
+              INSERT INTO product_search (rowid, shop_id, name, brand_name, category_name)
+              {_INDEXED_ROW} WHERE p.id = NEW.id;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_update_search
+            AFTER UPDATE OF name, brand_id, category_id, shop_id ON products
+            BEGIN
+              UPDATE product_search
+              SET shop_id = NEW.shop_id,
+                  name = NEW.name,
+                  brand_name = (SELECT b.name FROM brands b WHERE b.id = NEW.brand_id),
+                  category_name = (SELECT c.name FROM categories c WHERE c.id = NEW.category_id)
+              WHERE rowid = NEW.id;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_delete_search
+            AFTER DELETE ON products
+            BEGIN
+              DELETE FROM product_search WHERE rowid = OLD.id;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_brands_update_search
+            AFTER UPDATE OF name ON brands
+            BEGIN
+              UPDATE product_search SET brand_name = NEW.name
+              WHERE rowid IN (SELECT id FROM products WHERE brand_id = NEW.id);
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_categories_update_search
+            AFTER UPDATE OF name ON categories
+            BEGIN
+              UPDATE product_search SET category_name = NEW.name
+              WHERE rowid IN (SELECT id FROM products WHERE category_id = NEW.id);
+            END;
+            """,
+        ]:
+            db.execute(sql)
+
+    @staticmethod
+    def enabled(db) -> bool:
+        row = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search';"
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def rebuild(db):
+        """Re-index every product from scratch (backfill / repair)."""
+        if not ProductSearch.enabled(db):
+            return
+        db.execute("DELETE FROM product_search;")
+        db.execute(f"""
+            INSERT INTO product_search (rowid, shop_id, name, brand_name, category_name)
+            {_INDEXED_ROW};
+        """)
+
+    @staticmethod
+    def match_expression(query: str) -> str | None:
+        """FTS5 query matching every typed word as a prefix, or None if there are none."""
+        tokens = _TOKEN_RE.findall(query or "")
+        if not tokens:
+            return None
+        return " ".join(f'"{token}"*' for token in tokens)
+
+    @staticmethod
+    def search(db, shop_id: int, query: str, *, limit: int = 50, offset: int = 0, in_stock: bool = False):
+        """Best matches first, each with current stock and its latest batch prices.
+
+        Every word in ``query`` must prefix-match the product, brand or category
+        name. An empty query lists the catalog newest first, like the pickers.
+        Returns (rows, has_more); rows are dicts.
+        """
+        columns = """
+            p.id, p.name, p.price, p.quantity,
+            b.name AS brand_name, c.name AS category_name,
+            p.last_purchase_rate AS purchase_rate, p.last_sale_price AS latest_sale_price
+        """
+        joins = """
+            LEFT JOIN brands b ON b.id = p.brand_id
+            LEFT JOIN categories c ON c.id = p.category_id
+        """
+        stock_filter = "AND p.quantity > 0" if in_stock else ""
+        match = ProductSearch.match_expression(query)
+
+        if match is None:
+            sql = f"""
+                SELECT {columns}
+                FROM products p
+                {joins}
+                WHERE p.shop_id = ? {stock_filter}
+                ORDER BY p.id DESC
+                LIMIT ? OFFSET ?;
+            """
+            params = (shop_id,)
+        elif ProductSearch.enabled(db):
+            # Name hits outrank brand/category hits.
+            sql = f"""
+                SELECT {columns}
+                FROM product_search
+                JOIN products p ON p.id = product_search.rowid
+                {joins}
+                WHERE product_search MATCH ? AND product_search.shop_id = ? {stock_filter}
+                ORDER BY bm25(product_search, 10.0, 2.0, 2.0, 0.0), p.name COLLATE NOCASE, p.id
+                LIMIT ? OFFSET ?;
+            """
+            params = (match, shop_id)
+        else:
+            tokens = _TOKEN_RE.findall(query)
+            word_filter = " AND ".join(
+                "(p.name LIKE ? OR b.name LIKE ? OR c.name LIKE ?)" for _ in tokens
+            )
+            sql = f"""
+                SELECT {columns}
+                FROM products p
+                {joins}
+                WHERE p.shop_id = ? AND {word_filter} {stock_filter}
+                ORDER BY p.name COLLATE NOCASE, p.id
+                LIMIT ? OFFSET ?;
+            """
+            params = (shop_id, *(f"%{token}%" for token in tokens for _ in range(3)))
+
+        # One extra row tells the caller whether another page exists.
+        rows = [dict(row) for row in db.execute(sql, (*params, limit + 1, offset)).fetchall()]
+        has_more = len(rows) > limit
+        return rows[:limit], has_more
+
+    @staticmethod
+    def by_ids(db, shop_id: int, product_ids):
+        """Rows shaped like search() results for specific products, in the given order."""
+        products = {}
+        ids = list(dict.fromkeys(product_ids))
+        if ids:
+            placeholders = ", ".join("?" for _ in ids)
+            for row in db.execute(f"""
+                SELECT p.id, p.name, p.price, p.quantity,
+                       b.name AS brand_name, c.name AS category_name,
+                       p.last_purchase_rate AS purchase_rate, p.last_sale_price AS latest_sale_price
+                FROM products p
+                LEFT JOIN brands b ON b.id = p.brand_id
+                LEFT JOIN categories c ON c.id = p.category_id
+                WHERE p.shop_id = ? AND p.id IN ({placeholders});
+            """, (shop_id, *ids)).fetchall():
+                products[row["id"]] = dict(row)
+        return [products[pid] for pid in ids if pid in products]
@@ -0,0 +1,84 @@
+class RestockRollup:
+    @staticmethod
+    def create_table(db):
+        db.execute("""
+        CREATE TABLE IF NOT EXISTS restock_rollup (
+          shop_id         INTEGER NOT NULL,
+          batch_date      TEXT NOT NULL,
+          product_count   INTEGER NOT NULL DEFAULT 0,
+          total_purchase  REAL NOT NULL DEFAULT 0,
+          PRIMARY KEY (shop_id, batch_date),
+          FOREIGN KEY (shop_id) REFERENCES shops(id) ON DELETE CASCADE
+        );
+        """)
+
+        # Kept in step with stock_batches by triggers, so every way a batch is
+        # added or removed (including a product delete cascading to its
+        # batches) lands here without the callers knowing.
+        db.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_batches_insert_restock_rollup
+        AFTER INSERT ON stock_batches
+        BEGIN
+          INSERT INTO restock_rollup (shop_id, batch_date, product_count, total_purchase)
+          VALUES (NEW.shop_id, NEW.batch_date, 1, NEW.purchase_rate * NEW.quantity)
+          ON CONFLICT(shop_id, batch_date) DO UPDATE SET
+            product_count  = product_count + 1,
+            total_purchase = total_purchase + excluded.total_purchase;
+        END;
+        """)
+        db.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_batches_delete_restock_rollup
+        AFTER DELETE ON stock_batches
+        BEGIN
+          UPDATE restock_rollup
+          SET product_count = product_count - 1,
+              total_purchase = total_purchase - OLD.purchase_rate * OLD.quantity
+          WHERE shop_id = OLD.shop_id AND batch_date = OLD.batch_date;
+          DELETE FROM restock_rollup
+          WHERE shop_id = OLD.shop_id AND batch_date = OLD.batch_date AND product_count <= 0;
+        END;
+        """)
+        db.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_batches_update_restock_rollup
+        AFTER UPDATE OF shop_id, batch_date, quantity, purchase_rate ON stock_batches
+        BEGIN
+          UPDATE restock_rollup
+          SET product_count = product_count - 1,
+              total_purchase = total_purchase - OLD.purchase_rate * OLD.quantity
+          WHERE shop_id = OLD.shop_id AND batch_date = OLD.batch_date;
+          DELETE FROM restock_rollup
+          WHERE shop_id = OLD.shop_id AND batch_date = OLD.batch_date AND product_count <= 0;
+          INSERT INTO restock_rollup (shop_id, batch_date, product_count, total_purchase)
+          VALUES (NEW.shop_id, NEW.batch_date, 1, NEW.purchase_rate * NEW.quantity)
+          ON CONFLICT(shop_id, batch_date) DO UPDATE SET
+            product_count  = product_count + 1,
+            total_purchase = total_purchase + excluded.total_purchase;
+        END;
+        """)
+
+    @staticmethod
+    def page(db, shop_id: int, *, before: str | None = None, limit: int = 30):
+        """Restock dates newest first, from ``before`` (exclusive). Returns (rows, has_more)."""
+        keyset = "" if before is None else "AND batch_date < ?"
+        params = (shop_id,) if before is None else (shop_id, before)
+        rows = db.execute(f"""
+            SELECT batch_date, product_count, total_purchase
+            FROM restock_rollup
+            WHERE shop_id = ? {keyset}
+            ORDER BY batch_date DESC
+            LIMIT ?;
+        """, (*params, limit + 1)).fetchall()
+        return rows[:limit], len(rows) > limit
+
+    @staticmethod
+    def rebuild(db, shop_id: int | None = None):
+        scope = "" if shop_id is None else "WHERE shop_id = ?"
+        params = () if shop_id is None else (shop_id,)
+        db.execute(f"DELETE FROM restock_rollup {scope};", params)
+        db.execute(f"""
+            INSERT INTO restock_rollup (shop_id, batch_date, product_count, total_purchase)
+            SELECT shop_id, batch_date, COUNT(*), SUM(purchase_rate * quantity)
+            FROM stock_batches
+            {scope}
+            GROUP BY shop_id, batch_date;
+        """, params)
@@ -1,5 +1,31 @@
 import sqlite3
 
+from .shop_settings import DEFAULT_UTC_OFFSET_MINUTES
+from .daily_sales_rollup import DailySalesRollup
+from .customer_stats import CustomerStats
+from .product_sales_stats import ProductSalesStats
+from .product import Product
+
+# Stay well under SQLITE_MAX_VARIABLE_NUMBER (999 on older builds).
+ITEM_LOOKUP_CHUNK = 500
+
+# No foreign key to products: a line keeps its product_id and product_name
+# after the product is deleted, so old sales and reports stay intact.
+# Migration 14 rebuilds tables created with the old ON DELETE CASCADE key.
+SALE_ITEMS_COLUMNS = """
+  id                 INTEGER PRIMARY KEY AUTOINCREMENT,
+  sale_id            INTEGER NOT NULL,
+  product_id         INTEGER NOT NULL,
+  quantity           INTEGER NOT NULL,
+  unit_price         REAL NOT NULL,
+  returned_quantity  INTEGER NOT NULL DEFAULT 0,
+  returned_at        TEXT,
+  unit_cost          REAL,
+  product_name       TEXT,
+  sale_created_at    TEXT,
+  FOREIGN KEY (sale_id) REFERENCES sales(id) ON DELETE CASCADE
+"""
+
 
 class Sale:
     @staticmethod
@@ -13,6 +39,8 @@ class Sale:
           customer_id        INTEGER,
           reference_sale_id  INTEGER,
           created_at         TEXT NOT NULL DEFAULT (datetime('now')),
+          sale_date          TEXT,
+          client_key         TEXT,
           FOREIGN KEY (shop_id)           REFERENCES shops(id) ON DELETE CASCADE,
           FOREIGN KEY (customer_id)       REFERENCES customers(id) ON DELETE SET NULL,
           FOREIGN KEY (reference_sale_id) REFERENCES sales(id) ON DELETE SET NULL
@@ -28,20 +56,18 @@ class Sale:
             db.execute("ALTER TABLE sales ADD COLUMN reference_sale_id INTEGER REFERENCES sales(id) ON DELETE SET NULL;")
         except sqlite3.OperationalError:
             pass
+        # Business-day date in the shop's local time; backfilled by migration 2.
+        try:
+            db.execute("ALTER TABLE sales ADD COLUMN sale_date TEXT;")
+        except sqlite3.OperationalError:
+            pass
+        # Idempotency key sent by offline tills; unique per shop (migration 4).
+        try:
+            db.execute("ALTER TABLE sales ADD COLUMN client_key TEXT;")
+        except sqlite3.OperationalError:
+            pass
 
-        db.execute("""
-        CREATE TABLE IF NOT EXISTS sale_items (
-          id                 INTEGER PRIMARY KEY AUTOINCREMENT,
-          sale_id            INTEGER NOT NULL,
-          product_id         INTEGER NOT NULL,
-          quantity           INTEGER NOT NULL,
-          unit_price         REAL NOT NULL,
-          returned_quantity  INTEGER NOT NULL DEFAULT 0,
-          returned_at        TEXT,
-          FOREIGN KEY (sale_id) REFERENCES sales(id) ON DELETE CASCADE,
-          FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
-        );
-        """)
+        db.execute(f"CREATE TABLE IF NOT EXISTS sale_items ({SALE_ITEMS_COLUMNS});")
         try:
             db.execute("ALTER TABLE sale_items ADD COLUMN returned_quantity INTEGER NOT NULL DEFAULT 0;")
         except sqlite3.OperationalError:
@@ -50,6 +76,23 @@ class Sale:
             db.execute("ALTER TABLE sale_items ADD COLUMN returned_at TEXT;")
         except sqlite3.OperationalError:
             pass
+        # Purchase rate of the stock sold, fixed when the line is recorded
+        # (NULL if the product had no restock yet); backfilled by migration 9.
+        try:
+            db.execute("ALTER TABLE sale_items ADD COLUMN unit_cost REAL;")
+        except sqlite3.OperationalError:
+            pass
+        # Product name at the time of the sale; backfilled by migration 14.
+        try:
+            db.execute("ALTER TABLE sale_items ADD COLUMN product_name TEXT;")
+        except sqlite3.OperationalError:
+            pass
+        # Copy of sales.created_at, so a product's lines can be walked in
+        # journal order; backfilled by migration 16.
+        try:
+            db.execute("ALTER TABLE sale_items ADD COLUMN sale_created_at TEXT;")
+        except sqlite3.OperationalError:
+            pass
         db.execute("""
             UPDATE sale_items
             SET returned_quantity = quantity
@@ -65,64 +108,158 @@ class Sale:
         items: list[dict],
         customer_id: int | None = None,
         reference_sale_id: int | None = None,
+        client_key: str | None = None,
+        created_at: str | None = None,
     ):
+        # created_at (UTC, "YYYY-MM-DD HH:MM:SS") defaults to now; synced offline
+        # sales pass the time they were rung up so they land on the right day.
+        # Items may carry a unit_cost and product_name (returns pass the sold
+        # line's); the rest are costed at the product's latest restock rate and
+        # named after the product as it is now.
         total_amount = sum(item["quantity"] * item["unit_price"] for item in items)
-        cursor = db.execute("""
-            INSERT INTO sales (shop_id, sale_type, total_amount, customer_id, reference_sale_id)
-            VALUES (?, ?, ?, ?, ?);
-        """, (shop_id, sale_type, total_amount, customer_id, reference_sale_id))
+        cursor = db.execute(f"""
+            INSERT INTO sales (
+              shop_id, sale_type, total_amount, customer_id, reference_sale_id,
+              client_key, created_at, sale_date
+            )
+            VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, datetime('now')), date(COALESCE(?, 'now'), COALESCE(
+              (SELECT utc_offset_minutes FROM shop_settings WHERE shop_id = ?),
+              {DEFAULT_UTC_OFFSET_MINUTES}
+            ) || ' minutes'));
+        """, (
+            shop_id, sale_type, total_amount, customer_id, reference_sale_id,
+            client_key, created_at, created_at, shop_id,
+        ))
         sale_id = cursor.lastrowid
 
-        for item in items:
-            db.execute("""
-                INSERT INTO sale_items (sale_id, product_id, quantity, unit_price)
-                VALUES (?, ?, ?, ?);
-            """, (sale_id, item["product_id"], item["quantity"], item["unit_price"]))
+        latest_rates = Product.last_purchase_rates(
+            db, shop_id, [item["product_id"] for item in items if "unit_cost" not in item]
+        )
+        db.executemany("""
+            INSERT INTO sale_items (
+              sale_id, product_id, quantity, unit_price, unit_cost, product_name, sale_created_at
+            )
+            VALUES (
+              ?, ?, ?, ?, ?, COALESCE(?, (SELECT name FROM products WHERE id = ?)),
+              (SELECT created_at FROM sales WHERE id = ?)
+            );
+        """, [
+            (
+                sale_id,
+                item["product_id"],
+                item["quantity"],
+                item["unit_price"],
+                item["unit_cost"] if "unit_cost" in item else latest_rates.get(item["product_id"]),
+                item.get("product_name"),
+                item["product_id"],
+                sale_id,
+            )
+            for item in items
+        ])
+
+        DailySalesRollup.apply_sale(
+            db,
+            sale_id,
+            sale_type,
+            total_amount,
+            sum(item["quantity"] for item in items),
+        )
+        ProductSalesStats.apply_sale(db, sale_id)
+        if customer_id is not None:
+            CustomerStats.apply_sale(db, sale_id, sale_type)
         return sale_id
 
     @staticmethod
-    def recent_with_items(db, shop_id: int, limit: int = 5):
-        sales = db.execute("""
-            SELECT s.*, c.name AS customer_name, c.phone AS customer_phone,
-                   ref.created_at AS reference_created_at
-            FROM sales s
-            LEFT JOIN customers c ON c.id = s.customer_id
-            LEFT JOIN sales ref ON ref.id = s.reference_sale_id
-            WHERE s.shop_id = ?
-            ORDER BY s.created_at DESC
-            LIMIT ?;
-        """, (shop_id, limit)).fetchall()
+    def id_for_client_key(db, shop_id: int, client_key: str):
+        row = db.execute("""
+            SELECT id FROM sales
+            WHERE shop_id = ? AND client_key = ?
+            LIMIT 1;
+        """, (shop_id, client_key)).fetchone()
+        return row["id"] if row else None
+
+    @staticmethod
+    def mark_returned(db, returned: dict) -> list[int]:
+        """Add returned quantities, {sale_item_id: quantity}, where that much is still unreturned.
 
-        result = []
-        for sale in sales:
-            rows = db.execute("""
-                SELECT si.id, si.product_id, si.quantity, si.unit_price,
-                       si.returned_quantity, si.returned_at, p.name AS product_name
+        The check and the update are one statement per chunk of lines, so
+        concurrent returns of a line cannot both take its last units. Returns
+        the ids of lines with too little left; if there are any, the caller
+        must roll back, since the other lines have already been updated.
+        """
+        items = list(returned.items())
+        updated = set()
+        # Each line binds its (id, quantity) pair three times, plus its id once.
+        for start in range(0, len(items), ITEM_LOOKUP_CHUNK // 4):
+            chunk = items[start:start + ITEM_LOOKUP_CHUNK // 4]
+            cases = " ".join("WHEN ? THEN ?" for _ in chunk)
+            case_params = tuple(value for item_id, qty in chunk for value in (item_id, qty))
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = db.execute(f"""
+                UPDATE sale_items
+                SET returned_quantity = returned_quantity + CASE id {cases} END,
+                    returned_at = CASE WHEN returned_quantity + CASE id {cases} END >= quantity
+                                       THEN datetime('now') END
+                WHERE id IN ({placeholders})
+                  AND returned_quantity + CASE id {cases} END <= quantity
+                RETURNING id;
+            """, (*case_params, *case_params, *(item_id for item_id, _ in chunk), *case_params)).fetchall()
+            updated.update(row["id"] for row in rows)
+        if len(updated) == len(items):
+            return []
+        return [item_id for item_id, _ in items if item_id not in updated]
+
+    @staticmethod
+    def items_for_sales(db, sale_ids: list[int]):
+        items_by_sale = {}
+        for start in range(0, len(sale_ids), ITEM_LOOKUP_CHUNK):
+            chunk = sale_ids[start:start + ITEM_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = db.execute(f"""
+                SELECT si.id, si.sale_id, si.product_id, si.quantity, si.unit_price,
+                       si.unit_cost, si.returned_quantity, si.returned_at, si.product_name
                 FROM sale_items si
-                JOIN products p ON p.id = si.product_id
-                WHERE si.sale_id = ?
-                ORDER BY si.id ASC;
-            """, (sale["id"],)).fetchall()
-            items = []
+                WHERE si.sale_id IN ({placeholders})
+                ORDER BY si.sale_id, si.id ASC;
+            """, chunk).fetchall()
             for row in rows:
                 returned_qty = row["returned_quantity"] or 0
-                items.append(
+                items_by_sale.setdefault(row["sale_id"], []).append(
                     {
                         "id": row["id"],
                         "product_id": row["product_id"],
                         "quantity": row["quantity"],
                         "unit_price": row["unit_price"],
+                        "unit_cost": row["unit_cost"],
                         "product_name": row["product_name"],
                         "returned_quantity": returned_qty,
                         "remaining_quantity": max(row["quantity"] - returned_qty, 0),
                         "returned_at": row["returned_at"],
                     }
                 )
-            result.append({
+        return items_by_sale
+
+    @staticmethod
+    def recent_with_items(db, shop_id: int, limit: int = 5):
+        sales = db.execute("""
+            SELECT s.*, c.name AS customer_name, c.phone AS customer_phone,
+                   ref.created_at AS reference_created_at
+            FROM sales s
+            LEFT JOIN customers c ON c.id = s.customer_id
+            LEFT JOIN sales ref ON ref.id = s.reference_sale_id
+            WHERE s.shop_id = ?
+            ORDER BY s.created_at DESC
+            LIMIT ?;
+        """, (shop_id, limit)).fetchall()
+
+        items_by_sale = Sale.items_for_sales(db, [sale["id"] for sale in sales])
+        return [
+            {
                 "sale": sale,
-                "sale_items": items,
-            })
-        return result
+                "sale_items": items_by_sale.get(sale["id"], []),
+            }
+            for sale in sales
+        ]
 
     @staticmethod
     def get_with_items(db, shop_id: int, sale_id: int):
@@ -137,29 +274,7 @@ class Sale:
         """, (sale_id, shop_id)).fetchone()
         if not sale:
             return None, []
-        rows = db.execute("""
-            SELECT si.id, si.product_id, si.quantity, si.unit_price,
-                   si.returned_quantity, si.returned_at, p.name AS product_name
-            FROM sale_items si
-            JOIN products p ON p.id = si.product_id
-            WHERE si.sale_id = ?
-            ORDER BY si.id ASC;
-        """, (sale_id,)).fetchall()
-        items = []
-        for row in rows:
-            returned_qty = row["returned_quantity"] or 0
-            items.append(
-                {
-                    "id": row["id"],
-                    "product_id": row["product_id"],
-                    "quantity": row["quantity"],
-                    "unit_price": row["unit_price"],
-                    "product_name": row["product_name"],
-                    "returned_quantity": returned_qty,
-                    "remaining_quantity": max(row["quantity"] - returned_qty, 0),
-                    "returned_at": row["returned_at"],
-                }
-            )
+        items = Sale.items_for_sales(db, [sale_id]).get(sale_id, [])
         return sale, items
 
     @staticmethod
@@ -171,97 +286,140 @@ class Sale:
             LEFT JOIN customers c ON c.id = s.customer_id
             LEFT JOIN sales ref ON ref.id = s.reference_sale_id
             WHERE s.shop_id = ?
-              AND date(s.created_at) BETWEEN date(?) AND date(?)
-            ORDER BY s.created_at DESC;
+              AND s.sale_date BETWEEN date(?) AND date(?)
+            ORDER BY s.sale_date DESC, s.created_at DESC;
         """, (shop_id, start_date, end_date)).fetchall()
 
-        detailed = []
-        for sale in sales:
-            rows = db.execute("""
-                SELECT si.id, si.product_id, si.quantity, si.unit_price,
-                       si.returned_quantity, si.returned_at, p.name AS product_name
-                FROM sale_items si
-                JOIN products p ON p.id = si.product_id
-                WHERE si.sale_id = ?
-                ORDER BY si.id ASC;
-            """, (sale["id"],)).fetchall()
-            items = []
-            for row in rows:
-                returned_qty = row["returned_quantity"] or 0
-                items.append(
-                    {
-                        "id": row["id"],
-                        "product_id": row["product_id"],
-                        "quantity": row["quantity"],
-                        "unit_price": row["unit_price"],
-                        "product_name": row["product_name"],
-                        "returned_quantity": returned_qty,
-                        "remaining_quantity": max(row["quantity"] - returned_qty, 0),
-                        "returned_at": row["returned_at"],
-                    }
-                )
-            detailed.append(
-                {
-                    "sale": sale,
-                    "sale_items": items,
-                }
-            )
-        return detailed
+        items_by_sale = Sale.items_for_sales(db, [sale["id"] for sale in sales])
+        return [
+            {
+                "sale": sale,
+                "sale_items": items_by_sale.get(sale["id"], []),
+            }
+            for sale in sales
+        ]
 
     @staticmethod
-    def daily_summary(db, shop_id: int, start_date: str, end_date: str):
-        rows = db.execute("""
-            WITH sale_totals AS (
-              SELECT
-                s.id,
-                s.sale_type,
-                date(s.created_at) AS sale_date,
-                s.total_amount,
-                COALESCE(SUM(si.quantity), 0) AS item_count,
-                COALESCE(SUM(si.returned_quantity), 0) AS returned_count
-              FROM sales s
-              LEFT JOIN sale_items si ON si.sale_id = s.id
-              WHERE s.shop_id = ?
-                AND date(s.created_at) BETWEEN date(?) AND date(?)
-              GROUP BY s.id
-            )
-            SELECT sale_date,
-                   sale_type,
-                   COUNT(*) AS txn_count,
-                   SUM(total_amount) AS total_amount,
-                   SUM(item_count) AS item_quantity,
-                   SUM(returned_count) AS returned_count
-            FROM sale_totals
-            GROUP BY sale_date, sale_type
-            ORDER BY sale_date DESC;
-        """, (shop_id, start_date, end_date)).fetchall()
+    def journal_page(db, shop_id: int, *, before=None, customer_id: int | None = None,
+                     product_id: int | None = None, sale_type: str | None = None, limit: int = 25):
+        """One page of sales and returns, newest first, each with its items.
 
-        summary_map = {}
-        for row in rows:
-            sale_date = row["sale_date"]
-            entry = summary_map.setdefault(
-                sale_date,
-                {
-                    "sale_date": sale_date,
-                    "sales_total": 0.0,
-                    "returns_total": 0.0,
-                    "sale_count": 0,
-                    "return_count": 0,
-                    "sold_items": 0,
-                    "returned_items": 0,
-                },
+        ``before`` is the (created_at, id) of the last row of the previous page.
+        Rows come straight off the (shop_id, created_at), (shop_id, sale_type,
+        created_at) or (shop_id, customer_id, created_at) index, or with a
+        product filter off that product's lines in ix_sale_items_product_created,
+        so a page reads about ``limit`` sales however long the history is.
+        Returns (entries, has_more).
+        """
+        if product_id is not None:
+            return Sale._product_journal_page(
+                db, shop_id, product_id, before=before, customer_id=customer_id, sale_type=sale_type, limit=limit
             )
-            amount = row["total_amount"] or 0.0
-            count = row["txn_count"] or 0
-            item_qty = row["item_quantity"] or 0
-            if row["sale_type"] == "sale":
-                entry["sales_total"] += amount
-                entry["sale_count"] += count
-                entry["sold_items"] += item_qty
-            else:
-                entry["returns_total"] += amount
-                entry["return_count"] += count
-                entry["returned_items"] += item_qty
-        summary = list(summary_map.values())
-        summary.sort(key=lambda entry: entry["sale_date"], reverse=True)
-        return summary
+        filters = ""
+        params = [shop_id]
+        if sale_type is not None:
+            filters += " AND s.sale_type = ?"
+            params.append(sale_type)
+        if customer_id is not None:
+            filters += " AND s.customer_id = ?"
+            params.append(customer_id)
+        if before is not None:
+            created_at, sale_id = before
+            # The <= bound lets SQLite start the index scan at the cursor.
+            filters += " AND s.created_at <= ? AND (s.created_at < ? OR s.id < ?)"
+            params += [created_at, created_at, sale_id]
+
+        sales = db.execute(f"""
+            SELECT s.*, c.name AS customer_name, c.phone AS customer_phone,
+                   ref.created_at AS reference_created_at
+            FROM sales s
+            LEFT JOIN customers c ON c.id = s.customer_id
+            LEFT JOIN sales ref ON ref.id = s.reference_sale_id
+            WHERE s.shop_id = ? {filters}
+            ORDER BY s.created_at DESC, s.id DESC
+            LIMIT ?;
+        """, (*params, limit + 1)).fetchall()
+
+        return Sale._journal_entries(db, sales, limit)
+
+    @staticmethod
+    def _product_journal_page(db, shop_id: int, product_id: int, *, before, customer_id, sale_type, limit):
+        filters = ""
+        params = [product_id, shop_id]
+        if sale_type is not None:
+            filters += " AND s.sale_type = ?"
+            params.append(sale_type)
+        if customer_id is not None:
+            filters += " AND s.customer_id = ?"
+            params.append(customer_id)
+        if before is not None:
+            created_at, sale_id = before
+            filters += " AND si.sale_created_at <= ? AND (si.sale_created_at < ? OR si.sale_id < ?)"
+            params += [created_at, created_at, sale_id]
+
+        # DISTINCT: a sale may list the product on more than one line; those
+        # lines are adjacent in index order, so no sort is needed.
+        sales = db.execute(f"""
+            SELECT DISTINCT s.*, c.name AS customer_name, c.phone AS customer_phone,
+                   ref.created_at AS reference_created_at
+            FROM sale_items si
+            JOIN sales s ON s.id = si.sale_id
+            LEFT JOIN customers c ON c.id = s.customer_id
+            LEFT JOIN sales ref ON ref.id = s.reference_sale_id
+            WHERE si.product_id = ? AND s.shop_id = ? {filters}
+            ORDER BY si.sale_created_at DESC, si.sale_id DESC
+            LIMIT ?;
+        """, (*params, limit + 1)).fetchall()
+        return Sale._journal_entries(db, sales, limit)
+
+    @staticmethod
+    def _journal_entries(db, sales, limit: int):
+        has_more = len(sales) > limit
+        sales = sales[:limit]
+        items_by_sale = Sale.items_for_sales(db, [sale["id"] for sale in sales])
+        return [
+            {
+                "sale": sale,
+                "sale_items": items_by_sale.get(sale["id"], []),
+            }
+            for sale in sales
+        ], has_more
+
+    @staticmethod
+    def product_lines_page(db, shop_id: int, product_id: int, *, before: int | None = None, limit: int = 50):
+        """One page of a product's sale and return lines, most recently recorded first.
+
+        Walks ix_sale_items_product backwards from ``before`` (a sale_items id),
+        joining each line to its sale, so a page costs ``limit`` lines however
+        many the product has. Returns (lines, has_more).
+        """
+        keyset = "" if before is None else "AND si.id < ?"
+        params = (product_id, shop_id) if before is None else (product_id, shop_id, before)
+        lines = db.execute(f"""
+            SELECT si.id, si.sale_id, si.quantity, si.unit_price, si.returned_quantity,
+                   s.sale_type, s.created_at, s.customer_id, s.reference_sale_id,
+                   c.name AS customer_name
+            FROM sale_items si
+            JOIN sales s ON s.id = si.sale_id
+            LEFT JOIN customers c ON c.id = s.customer_id
+            WHERE si.product_id = ? AND s.shop_id = ? {keyset}
+            ORDER BY si.id DESC
+            LIMIT ?;
+        """, (*params, limit + 1)).fetchall()
+        return lines[:limit], len(lines) > limit
+
+    @staticmethod
+    def daily_summary(db, shop_id: int, start_date: str, end_date: str):
+        rows = DailySalesRollup.between(db, shop_id, start_date, end_date)
+        return [
+            {
+                "sale_date": row["sale_date"],
+                "sales_total": row["sales_total"] or 0.0,
+                "returns_total": row["returns_total"] or 0.0,
+                "sale_count": row["sale_count"] or 0,
+                "return_count": row["return_count"] or 0,
+                "sold_items": row["sold_items"] or 0,
+                "returned_items": row["returned_items"] or 0,
+            }
+            for row in rows
+        ]
@@ -1,23 +1,43 @@
+# Pakistan Standard Time (UTC+05:00, no daylight saving).
+DEFAULT_UTC_OFFSET_MINUTES = 300
+
+
 class ShopSettings:
     @staticmethod
     def create_table(db):
         db.execute("""
         CREATE TABLE IF NOT EXISTS shop_settings (
-          shop_id          INTEGER PRIMARY KEY,
-          expense_percent  REAL NOT NULL DEFAULT 0,
-          updated_at       TEXT NOT NULL DEFAULT (datetime('now')),
+          shop_id            INTEGER PRIMARY KEY,
+          expense_percent    REAL NOT NULL DEFAULT 0,
+          utc_offset_minutes INTEGER NOT NULL DEFAULT 300,
+          updated_at         TEXT NOT NULL DEFAULT (datetime('now')),
           FOREIGN KEY (shop_id) REFERENCES shops(id) ON DELETE CASCADE
         );
         """)
 
+        try:
+            db.execute("ALTER TABLE shop_settings ADD COLUMN utc_offset_minutes INTEGER NOT NULL DEFAULT 300;")
+        except Exception:
+            pass
+
     @staticmethod
     def get_for_shop(db, shop_id: int):
         row = db.execute(
-            "SELECT shop_id, expense_percent FROM shop_settings WHERE shop_id = ?;",
+            "SELECT shop_id, expense_percent, utc_offset_minutes FROM shop_settings WHERE shop_id = ?;",
             (shop_id,),
         ).fetchone()
         return row
 
+    @staticmethod
+    def utc_offset_minutes(db, shop_id: int) -> int:
+        row = db.execute(
+            "SELECT utc_offset_minutes FROM shop_settings WHERE shop_id = ?;",
+            (shop_id,),
+        ).fetchone()
+        if row is None or row["utc_offset_minutes"] is None:
+            return DEFAULT_UTC_OFFSET_MINUTES
+        return int(row["utc_offset_minutes"])
+
     @staticmethod
     def set_expense_percent(db, shop_id: int, expense_percent: float):
         db.execute(
@@ -1,3 +1,6 @@
+from .restock_rollup import RestockRollup
+
+
 class StockBatch:
     @staticmethod
     def create_table(db):
@@ -31,6 +34,22 @@ class StockBatch:
         except Exception:
             pass
 
+        # Keep products.last_* on the latest batch. A back-dated batch (older
+        # batch_date than the current latest) leaves them alone; on the same
+        # date the newer batch wins, matching latest_for_product's order.
+        db.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_batches_insert_last_restock
+        AFTER INSERT ON stock_batches
+        BEGIN
+          UPDATE products
+          SET last_purchase_rate = NEW.purchase_rate,
+              last_sale_price = NEW.sale_price,
+              last_restock_date = NEW.batch_date
+          WHERE id = NEW.product_id
+            AND (last_restock_date IS NULL OR last_restock_date <= NEW.batch_date);
+        END;
+        """)
+
     @staticmethod
     def create(db, shop_id: int, product_id: int, quantity: int, purchase_rate: float, sale_price: float, batch_date: str):
         db.execute(
@@ -42,17 +61,26 @@ class StockBatch:
         )
 
     @staticmethod
-    def all_by_shop(db, shop_id: int):
-        return db.execute(
+    def create_many(db, shop_id: int, batches: list[dict]):
+        db.executemany(
             """
-            SELECT sb.*, p.name AS product_name
-            FROM stock_batches sb
-            JOIN products p ON p.id = sb.product_id
-            WHERE sb.shop_id = ?
-            ORDER BY sb.batch_date DESC, sb.created_at DESC;
+            INSERT INTO stock_batches (shop_id, product_id, quantity, purchase_rate, sale_price, batch_date)
+            VALUES (?, ?, ?, ?, ?, ?);
             """,
-            (shop_id,),
-        ).fetchall()
+            [
+                (shop_id, b["product_id"], b["quantity"], b["purchase_rate"], b["sale_price"], b["batch_date"])
+                for b in batches
+            ],
+        )
+
+    @staticmethod
+    def summary_by_date(db, shop_id: int, *, before: str | None = None, limit: int = 30):
+        """Restock dates newest first: batch count and purchase total. Returns (rows, has_more).
+
+        Read from restock_rollup, so a page costs ``limit`` rows however long
+        the restock history is.
+        """
+        return RestockRollup.page(db, shop_id, before=before, limit=limit)
 
     @staticmethod
     def by_date(db, shop_id: int, batch_date: str):
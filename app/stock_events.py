@@ -0,0 +1,84 @@
+import threading
+from collections import deque
+
+from flask import current_app
+
+
+class Subscription:
+    """One live-stock client: a bounded buffer of pending events.
+
+    When a slow client falls ``max_events`` behind, the oldest events are
+    dropped and the next read returns a ("reset", {}) event, so the client
+    knows its quantities may be stale.
+    """
+
+    def __init__(self, shop_id: int, max_events: int):
+        self.shop_id = shop_id
+        self.max_events = max(int(max_events), 1)
+        self._events = deque()
+        self._overflowed = False
+        self._cond = threading.Condition()
+
+    def put(self, event):
+        with self._cond:
+            if len(self._events) >= self.max_events:
+                self._events.popleft()
+                self._overflowed = True
+            self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout: float):
+        """Next (name, data) event, or None if nothing arrived within ``timeout``."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._events or self._overflowed, timeout)
+            if self._overflowed:
+                self._overflowed = False
+                return ("reset", {})
+            if self._events:
+                return self._events.popleft()
+            return None
+
+
+class StockEventHub:
+    """In-process publish/subscribe of stock changes, keyed by shop.
+
+    Only clients connected to this process are notified; with several worker
+    processes each serves its own subscribers.
+    """
+
+    def __init__(self, buffer_size: int = 64):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, shop_id: int) -> Subscription:
+        subscription = Subscription(shop_id, self.buffer_size)
+        with self._lock:
+            self._subscribers.setdefault(shop_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.shop_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.shop_id]
+
+    def has_subscribers(self, shop_id: int) -> bool:
+        with self._lock:
+            return bool(self._subscribers.get(shop_id))
+
+    def publish(self, shop_id: int, name: str, data: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(shop_id, ()))
+        for subscription in subscribers:
+            subscription.put((name, data))
+
+
+def get_stock_hub(app=None) -> StockEventHub:
+    app = app or current_app
+    hub = app.extensions.get("stock_event_hub")
+    if hub is None:
+        hub = app.extensions.setdefault("stock_event_hub", StockEventHub(app.config.get("SSE_CLIENT_BUFFER", 64)))
+    return hub
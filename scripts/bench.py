@@ -0,0 +1,295 @@
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.db import get_db, get_write_stats  # noqa: E402
+from app.models.sale import Sale  # noqa: E402
+
+MANAGER_USERNAME = "bench-manager"
+MANAGER_PASSWORD = "bench"
+
+# Stock sqlite3 behaviour before the connection layer: rollback journal, no reuse.
+UNTUNED_DB_CONFIG = {
+    "DB_JOURNAL_MODE": "DELETE",
+    "DB_SYNCHRONOUS": "FULL",
+    "DB_CACHE_SIZE": -2000,
+    "DB_MMAP_SIZE": 0,
+    "DB_TEMP_STORE": "DEFAULT",
+    "DB_POOL_SIZE": 0,
+}
+
+
+def build_app(db_path: str, overrides: dict | None = None):
+    config = {"DB_PATH": db_path, "TESTING": True}
+    config.update(overrides or {})
+    return create_app(config)
+
+
+def seed_shop(app, products: int = 200, sales: int = 2000, lines_per_sale: int = 3):
+    rng = random.Random(7)
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO users (role, full_name, username, password_hash) VALUES ('manager', 'Bench', ?, ?);",
+            (MANAGER_USERNAME, generate_password_hash(MANAGER_PASSWORD)),
+        )
+        manager_id = db.execute("SELECT id FROM users WHERE username = ?;", (MANAGER_USERNAME,)).fetchone()["id"]
+        shop_id = db.execute("INSERT INTO shops (name, created_by) VALUES ('Bench Store', 1);").lastrowid
+        db.execute(
+            "INSERT INTO shop_managers (shop_id, manager_user_id, created_by) VALUES (?, ?, 1);",
+            (shop_id, manager_id),
+        )
+        category_id = db.execute(
+            "INSERT INTO categories (shop_id, name) VALUES (?, 'General');", (shop_id,)
+        ).lastrowid
+        product_ids = []
+        for idx in range(products):
+            product_ids.append(db.execute(
+                "INSERT INTO products (shop_id, category_id, name, price, quantity) VALUES (?, ?, ?, 100, 1000000);",
+                (shop_id, category_id, f"Product {idx:05d}"),
+            ).lastrowid)
+            db.execute(
+                """
+                INSERT INTO stock_batches (shop_id, product_id, quantity, purchase_rate, sale_price, batch_date)
+                VALUES (?, ?, 1000000, 80, 100, date('now', '-30 days'));
+                """,
+                (shop_id, product_ids[-1]),
+            )
+        for _ in range(sales):
+            items = [
+                {"product_id": pid, "quantity": rng.randint(1, 5), "unit_price": 100.0}
+                for pid in rng.sample(product_ids, lines_per_sale)
+            ]
+            Sale.record(db, shop_id, "sale", items)
+        db.commit()
+    return shop_id, product_ids
+
+
+def login(app):
+    client = app.test_client()
+    response = client.post("/login", data={"username": MANAGER_USERNAME, "password": MANAGER_PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit("Benchmark login failed.")
+    return client
+
+
+def sale_form(product_ids, lines: int, rng):
+    picked = rng.sample(product_ids, lines)
+    return {
+        "sale_type": "sale",
+        "sale_product_id[]": [str(pid) for pid in picked],
+        "sale_quantity[]": ["1"] * lines,
+        "sale_price[]": ["100"] * lines,
+    }
+
+
+def measure_routes(app, paths, threads: int, requests_per_path: int, product_ids, writers: int):
+    results = {}
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = login(app)
+        return local.client
+
+    for path in paths:
+        stop = threading.Event()
+        write_count = [0]
+
+        def writer(seed):
+            rng = random.Random(seed)
+            writer_client = login(app)
+            while not stop.is_set():
+                writer_client.post("/manager/sales/record", data=sale_form(product_ids, 3, rng))
+                write_count[0] += 1
+
+        writer_threads = [threading.Thread(target=writer, args=(idx,)) for idx in range(writers)]
+        for thread in writer_threads:
+            thread.start()
+
+        def hit(_):
+            response = client().get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(hit, range(requests_per_path)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in writer_threads:
+            thread.join()
+        results[path] = (requests_per_path / elapsed, write_count[0] / elapsed)
+    return results
+
+
+def cmd_routes(args):
+    paths = ["/manager/sales", "/manager/reports"]
+    configs = [("untuned", UNTUNED_DB_CONFIG), ("tuned", {})]
+    print(f"{'config':10s} {'route':20s} {'req/s':>10s} {'writes/s':>10s}")
+    for label, overrides in configs:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(str(Path(tmp) / "bench.db"), overrides)
+            _, product_ids = seed_shop(app, products=args.products, sales=args.sales)
+            results = measure_routes(app, paths, args.threads, args.requests, product_ids, args.writers)
+            for path, (rps, wps) in results.items():
+                print(f"{label:10s} {path:20s} {rps:10.1f} {wps:10.1f}")
+            app.extensions["db_pool"].close_all()
+
+
+def cmd_invoice(args):
+    line_counts = [int(value) for value in args.lines.split(",")]
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(str(Path(tmp) / "bench.db"))
+        _, product_ids = seed_shop(app, products=max(args.products, max(line_counts)), sales=0)
+        clients = [login(app) for _ in range(args.threads)]
+        rng = random.Random(11)
+        print(f"{'lines':>6s} {'ms/invoice':>12s} {'ms/line':>10s} {'invoices/s':>12s}")
+        for lines in line_counts:
+            forms = [sale_form(product_ids, lines, rng) for _ in range(args.invoices)]
+
+            def post(idx):
+                started = time.perf_counter()
+                response = clients[idx % args.threads].post("/manager/sales/record", data=forms[idx])
+                if response.status_code != 302:
+                    raise RuntimeError(f"Recording a {lines}-line invoice returned {response.status_code}")
+                return time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                latencies = list(pool.map(post, range(args.invoices)))
+            elapsed = time.perf_counter() - started
+            latency_ms = sum(latencies) * 1000 / len(latencies)
+            print(f"{lines:6d} {latency_ms:12.2f} {latency_ms / lines:10.3f} {args.invoices / elapsed:12.1f}")
+        app.extensions["db_pool"].close_all()
+
+
+def percentile(values, pct: float):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def run_tills(app, product_ids, tills: int, sales: int, lines: int):
+    latencies = []
+    lost = [0]
+    lock = threading.Lock()
+
+    def till(seed):
+        rng = random.Random(seed)
+        client = login(app)
+        for _ in range(sales):
+            started = time.perf_counter()
+            response = client.post(
+                "/manager/sales/record",
+                data=sale_form(product_ids, lines, rng),
+                headers={"X-Requested-With": "XMLHttpRequest"},
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+                if response.status_code != 200:
+                    lost[0] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=till, args=(idx,)) for idx in range(tills)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, lost[0], time.perf_counter() - started
+
+
+def cmd_checkout(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        overrides = {} if args.busy_timeout_ms is None else {"DB_BUSY_TIMEOUT_MS": args.busy_timeout_ms}
+        app = build_app(str(Path(tmp) / "bench.db"), overrides)
+        _, product_ids = seed_shop(app, products=args.products, sales=0)
+        latencies, lost, elapsed = run_tills(app, product_ids, args.tills, args.sales, args.lines)
+
+        print(f"tills={args.tills} sales={len(latencies)} lost={lost} sales/s={len(latencies) / elapsed:.1f}")
+        print(f"latency ms: p50={percentile(latencies, 50):.1f} p99={percentile(latencies, 99):.1f} max={max(latencies):.1f}")
+        for route, stats in sorted(get_write_stats(app).snapshot().items()):
+            print(
+                f"{route}: transactions={stats['transactions']} lock_waits={stats['lock_waits']} "
+                f"retries={stats['retries']} failures={stats['failures']} max_wait_ms={stats['max_wait_ms']:.1f}"
+            )
+        app.extensions["db_pool"].close_all()
+
+
+def cmd_group_commit(args):
+    configs = [
+        ("per-request", {"GROUP_COMMIT": False}),
+        ("group", {"GROUP_COMMIT": True, "GROUP_COMMIT_WINDOW_MS": args.window_ms, "GROUP_COMMIT_MAX_BATCH": args.max_batch}),
+    ]
+    print(f"synchronous={args.synchronous} tills={args.tills} sales/till={args.sales}")
+    print(f"{'mode':12s} {'sales/s':>10s} {'p50 ms':>8s} {'p99 ms':>8s} {'lost':>6s} {'commits':>8s}")
+    for label, overrides in configs:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(str(Path(tmp) / "bench.db"), {"DB_SYNCHRONOUS": args.synchronous, **overrides})
+            _, product_ids = seed_shop(app, products=args.products, sales=0)
+            latencies, lost, elapsed = run_tills(app, product_ids, args.tills, args.sales, args.lines)
+            writer = app.extensions.get("group_commit_writer")
+            commits = writer.batches if writer else len(latencies)
+            print(
+                f"{label:12s} {len(latencies) / elapsed:10.1f} {percentile(latencies, 50):8.1f} "
+                f"{percentile(latencies, 99):8.1f} {lost:6d} {commits:8d}"
+            )
+            if writer:
+                writer.close()
+            app.extensions["db_pool"].close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the manager console.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    routes = sub.add_parser("routes", help="Requests per second on the sales and reports pages, untuned vs tuned SQLite.")
+    routes.add_argument("--threads", type=int, default=4, help="Concurrent reader threads")
+    routes.add_argument("--writers", type=int, default=1, help="Threads recording sales during the read phase")
+    routes.add_argument("--requests", type=int, default=200, help="Requests per route")
+    routes.add_argument("--products", type=int, default=200, help="Seeded catalog size")
+    routes.add_argument("--sales", type=int, default=2000, help="Seeded sales history")
+    routes.set_defaults(func=cmd_routes)
+
+    invoice = sub.add_parser("invoice", help="Latency of recording one invoice as its line count grows.")
+    invoice.add_argument("--lines", default="1,5,10,20,40", help="Comma-separated line counts")
+    invoice.add_argument("--invoices", type=int, default=200, help="Invoices recorded per line count")
+    invoice.add_argument("--threads", type=int, default=4, help="Concurrent cashiers")
+    invoice.add_argument("--products", type=int, default=200, help="Seeded catalog size")
+    invoice.set_defaults(func=cmd_invoice)
+
+    checkout = sub.add_parser("checkout", help="Several tills recording sales in one shop at once: lost sales, p99, lock waits.")
+    checkout.add_argument("--tills", type=int, default=4, help="Concurrent tills")
+    checkout.add_argument("--sales", type=int, default=250, help="Sales per till")
+    checkout.add_argument("--lines", type=int, default=3, help="Lines per sale")
+    checkout.add_argument("--products", type=int, default=200, help="Seeded catalog size")
+    checkout.add_argument("--busy-timeout-ms", type=int, default=None, help="Override DB_BUSY_TIMEOUT_MS (0 surfaces every conflict)")
+    checkout.set_defaults(func=cmd_checkout)
+
+    group = sub.add_parser("group-commit", help="Checkout throughput with a commit per sale vs group commit.")
+    group.add_argument("--tills", type=int, default=8, help="Concurrent tills")
+    group.add_argument("--sales", type=int, default=150, help="Sales per till")
+    group.add_argument("--lines", type=int, default=3, help="Lines per sale")
+    group.add_argument("--products", type=int, default=200, help="Seeded catalog size")
+    group.add_argument("--synchronous", default="FULL", help="DB_SYNCHRONOUS for both runs (FULL fsyncs every commit)")
+    group.add_argument("--window-ms", type=float, default=2.0, help="GROUP_COMMIT_WINDOW_MS")
+    group.add_argument("--max-batch", type=int, default=64, help="GROUP_COMMIT_MAX_BATCH")
+    group.set_defaults(func=cmd_group_commit)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
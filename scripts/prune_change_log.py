@@ -0,0 +1,50 @@
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from app.models import init_models  # noqa: E402
+from app.models.catalog_change import CatalogChange  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop old entries from the catalog change log read by tills.")
+    parser.add_argument("--db", default=None, help="Path to SQLite DB (defaults to instance/ezzystore.db)")
+    parser.add_argument("--keep-days", type=int, default=30, help="Keep changes from the last N days")
+    parser.add_argument("--dry-run", action="store_true", help="Run without committing changes")
+    args = parser.parse_args()
+
+    db_path = Path(args.db) if args.db else REPO_ROOT / "instance" / "ezzystore.db"
+    if not db_path.exists():
+        print(f"Database not found: {db_path}")
+        raise SystemExit(1)
+
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA foreign_keys = ON")
+    try:
+        init_models(db)
+        db.commit()
+
+        removed = CatalogChange.prune(db, args.keep_days)
+
+        if args.dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"Change log entries removed: {removed}")
+    if args.dry_run:
+        print("Dry run: no changes committed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from app.models import init_models  # noqa: E402
+from app.models.customer_stats import CustomerStats  # noqa: E402
+from app.models.daily_sales_rollup import DailySalesRollup  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.models.product_sales_stats import ProductSalesStats  # noqa: E402
+from app.models.restock_rollup import RestockRollup  # noqa: E402
+
+
+def resolve_shop_id(db, shop_name: str) -> int:
+    rows = db.execute("SELECT id FROM shops WHERE name = ?", (shop_name,)).fetchall()
+    if not rows:
+        print(f"Shop not found: {shop_name}")
+        raise SystemExit(1)
+    return rows[0]["id"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild derived reporting tables from the raw sales and restock history.")
+    parser.add_argument("--db", default=None, help="Path to SQLite DB (defaults to instance/ezzystore.db)")
+    parser.add_argument("--shop", default=None, help="Exact shop name (defaults to every shop)")
+    parser.add_argument("--dry-run", action="store_true", help="Run without committing changes")
+    args = parser.parse_args()
+
+    db_path = Path(args.db) if args.db else REPO_ROOT / "instance" / "ezzystore.db"
+    if not db_path.exists():
+        print(f"Database not found: {db_path}")
+        raise SystemExit(1)
+
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA foreign_keys = ON")
+    try:
+        init_models(db)
+        db.commit()
+
+        shop_id = resolve_shop_id(db, args.shop) if args.shop else None
+        DailySalesRollup.rebuild(db, shop_id)
+        rollup_rows = db.execute(
+            "SELECT COUNT(*) FROM daily_sales_rollup WHERE ? IS NULL OR shop_id = ?",
+            (shop_id, shop_id),
+        ).fetchone()[0]
+        CustomerStats.rebuild(db, shop_id)
+        customer_rows = db.execute(
+            "SELECT COUNT(*) FROM customer_stats WHERE ? IS NULL OR shop_id = ?",
+            (shop_id, shop_id),
+        ).fetchone()[0]
+        ProductSalesStats.rebuild(db, shop_id)
+        product_rows = db.execute(
+            "SELECT COUNT(*) FROM product_sales_stats WHERE ? IS NULL OR shop_id = ?",
+            (shop_id, shop_id),
+        ).fetchone()[0]
+        RestockRollup.rebuild(db, shop_id)
+        restock_rows = db.execute(
+            "SELECT COUNT(*) FROM restock_rollup WHERE ? IS NULL OR shop_id = ?",
+            (shop_id, shop_id),
+        ).fetchone()[0]
+        Product.rebuild_last_restock(db, shop_id)
+
+        if args.dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"Daily sales rollup rows: {rollup_rows}")
+    print(f"Customer stats rows: {customer_rows}")
+    print(f"Product sales stats rows: {product_rows}")
+    print(f"Restock rollup rows: {restock_rows}")
+    if args.dry_run:
+        print("Dry run: no changes committed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import random
+import sys
+from pathlib import Path
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from app import create_app  # noqa: E402
+from app.db import get_db  # noqa: E402
+from app.models.customer import Customer  # noqa: E402
+from app.models.sale import Sale  # noqa: E402
+
+MANAGER_USERNAME = "test-manager"
+MANAGER_PASSWORD = "test"
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({"DB_PATH": str(tmp_path / "test.db"), "TESTING": True})
+    yield app
+    app.extensions["db_pool"].close_all()
+
+
+@pytest.fixture
+def statements(app):
+    """The SQL statements the most recent request ran, in order."""
+    traced = []
+
+    @app.before_request
+    def _trace_statements():
+        traced.clear()
+        get_db().set_trace_callback(traced.append)
+
+    @app.after_request
+    def _stop_tracing(response):
+        get_db().set_trace_callback(None)
+        return response
+
+    return traced
+
+
+def _seed_shop(app, *, seed: int = 7, **history):
+    """A manager and a shop with a random history; see _add_history.
+
+    Returns (shop_id, product_ids, customer_ids).
+    """
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO users (role, full_name, username, password_hash) VALUES ('manager', 'Test', ?, ?);",
+            (MANAGER_USERNAME, generate_password_hash(MANAGER_PASSWORD)),
+        )
+        manager_id = db.execute("SELECT id FROM users WHERE username = ?;", (MANAGER_USERNAME,)).fetchone()["id"]
+        shop_id = db.execute("INSERT INTO shops (name, created_by) VALUES ('Test Store', 1);").lastrowid
+        db.execute(
+            "INSERT INTO shop_managers (shop_id, manager_user_id, created_by) VALUES (?, ?, 1);",
+            (shop_id, manager_id),
+        )
+        db.execute("INSERT INTO categories (shop_id, name) VALUES (?, 'General');", (shop_id,))
+        db.execute("INSERT INTO brands (shop_id, name) VALUES (?, 'House');", (shop_id,))
+        db.commit()
+    product_ids, customer_ids = _add_history(app, shop_id, seed=seed, **history)
+    return shop_id, product_ids, customer_ids
+
+
+def _add_history(app, shop_id: int, *, products: int, sales: int, customers: int = 0,
+                 returns: int = 0, seed: int = 7):
+    """Add products (each restocked once), customers, sales and returns to a shop.
+
+    Sales pick from every product and customer the shop has, old and new.
+    Returns the new (product_ids, customer_ids).
+    """
+    rng = random.Random(seed)
+    with app.app_context():
+        db = get_db()
+        category_id = db.execute("SELECT id FROM categories WHERE shop_id = ? LIMIT 1;", (shop_id,)).fetchone()[0]
+        brand_id = db.execute("SELECT id FROM brands WHERE shop_id = ? LIMIT 1;", (shop_id,)).fetchone()[0]
+        first = db.execute("SELECT COUNT(*) FROM products WHERE shop_id = ?;", (shop_id,)).fetchone()[0]
+
+        product_ids = []
+        for idx in range(first, first + products):
+            product_ids.append(db.execute(
+                """
+                INSERT INTO products (shop_id, brand_id, category_id, name, price, quantity)
+                VALUES (?, ?, ?, ?, 100, 1000000);
+                """,
+                (shop_id, brand_id, category_id, f"Product {idx:05d}"),
+            ).lastrowid)
+            db.execute(
+                """
+                INSERT INTO stock_batches (shop_id, product_id, quantity, purchase_rate, sale_price, batch_date)
+                VALUES (?, ?, 1000000, ?, 100, date('now', ?));
+                """,
+                (shop_id, product_ids[-1], rng.randint(50, 90), f"-{rng.randint(1, 60)} days"),
+            )
+        first = db.execute("SELECT COUNT(*) FROM customers WHERE shop_id = ?;", (shop_id,)).fetchone()[0]
+        customer_ids = [
+            Customer.create(db, shop_id, f"Customer {idx:05d}", None) for idx in range(first, first + customers)
+        ]
+
+        all_products = [row[0] for row in db.execute("SELECT id FROM products WHERE shop_id = ?;", (shop_id,))]
+        all_customers = [row[0] for row in db.execute("SELECT id FROM customers WHERE shop_id = ?;", (shop_id,))]
+        sale_ids = []
+        for _ in range(sales):
+            items = [
+                {"product_id": pid, "quantity": rng.randint(1, 5), "unit_price": float(rng.randint(90, 120))}
+                for pid in rng.sample(all_products, min(3, len(all_products)))
+            ]
+            customer_id = rng.choice(all_customers + [None])
+            created_at = f"2026-{rng.randint(1, 9):02d}-{rng.randint(10, 28)} {rng.randint(10, 20)}:00:00"
+            sale_ids.append(
+                (Sale.record(db, shop_id, "sale", items, customer_id=customer_id, created_at=created_at), customer_id)
+            )
+        for sale_id, customer_id in rng.sample(sale_ids, min(returns, len(sale_ids))):
+            _, sale_items = Sale.get_with_items(db, shop_id, sale_id)
+            line = sale_items[0]
+            Sale.record(
+                db,
+                shop_id,
+                "return",
+                [{
+                    "product_id": line["product_id"],
+                    "quantity": 1,
+                    "unit_price": line["unit_price"],
+                    "unit_cost": line["unit_cost"],
+                    "product_name": line["product_name"],
+                }],
+                customer_id=customer_id,
+                reference_sale_id=sale_id,
+            )
+            Sale.mark_returned(db, {line["id"]: 1})
+        db.commit()
+    return product_ids, customer_ids
+
+
+@pytest.fixture
+def seed_shop(app):
+    return lambda **kwargs: _seed_shop(app, **kwargs)
+
+
+@pytest.fixture
+def add_history(app):
+    return lambda shop_id, **kwargs: _add_history(app, shop_id, **kwargs)
+
+
+@pytest.fixture
+def login(app):
+    """Returns a test client logged in as the seeded shop's manager."""
+    def _login():
+        client = app.test_client()
+        response = client.post("/login", data={"username": MANAGER_USERNAME, "password": MANAGER_PASSWORD})
+        assert response.status_code == 302
+        return client
+    return _login
@@ -0,0 +1,75 @@
+from app.catalog_cache import get_catalog_cache
+from app.db import get_db
+from app.models.catalog_version import CatalogVersion
+
+
+def test_a_sale_keeps_the_cached_catalog_but_shows_live_stock(app, seed_shop, login):
+    shop_id, product_ids, _ = seed_shop(products=5, sales=3)
+    client = login()
+    assert client.get("/manager/products").status_code == 200
+    with app.app_context():
+        version = CatalogVersion.current(get_db(), shop_id)
+    misses = get_catalog_cache(app).misses
+
+    response = client.post("/manager/sales/record", data={
+        "sale_type": "sale",
+        "sale_product_id[]": [str(product_ids[0])],
+        "sale_quantity[]": ["7"],
+        "sale_price[]": ["100"],
+    })
+    assert response.status_code == 302
+
+    with app.app_context():
+        db = get_db()
+        assert CatalogVersion.current(db, shop_id) == version
+        quantity = db.execute("SELECT quantity FROM products WHERE id = ?;", (product_ids[0],)).fetchone()[0]
+    assert quantity < 1000000
+
+    page = client.get("/manager/products").get_data(as_text=True)
+    assert get_catalog_cache(app).misses == misses
+    assert str(quantity) in page
+
+
+def test_a_return_keeps_the_cached_catalog(app, seed_shop, login):
+    shop_id, product_ids, _ = seed_shop(products=5, sales=3)
+    client = login()
+    assert client.get("/manager/products").status_code == 200
+    with app.app_context():
+        db = get_db()
+        version = CatalogVersion.current(db, shop_id)
+        sale_id = db.execute("SELECT MAX(id) FROM sales WHERE sale_type = 'sale';").fetchone()[0]
+        line_id = db.execute("SELECT id FROM sale_items WHERE sale_id = ? LIMIT 1;", (sale_id,)).fetchone()[0]
+    misses = get_catalog_cache(app).misses
+
+    response = client.post(f"/manager/sales/{sale_id}/return", data={
+        "return_sale_item_id[]": [str(line_id)],
+        "return_quantity[]": ["1"],
+        "return_price[]": ["100"],
+    })
+    assert response.status_code == 302
+    response = client.post("/manager/sales/record", data={
+        "sale_type": "return",
+        "sale_product_id[]": [str(product_ids[1])],
+        "sale_quantity[]": ["2"],
+        "sale_price[]": ["100"],
+    })
+    assert response.status_code == 302
+
+    with app.app_context():
+        db = get_db()
+        assert db.execute("SELECT COUNT(*) FROM sales WHERE sale_type = 'return';").fetchone()[0] == 2
+        assert CatalogVersion.current(db, shop_id) == version
+    assert client.get("/manager/products").status_code == 200
+    assert get_catalog_cache(app).misses == misses
+
+
+def test_editing_a_product_still_bumps_the_version(app, seed_shop):
+    shop_id, product_ids, _ = seed_shop(products=2, sales=0)
+    with app.app_context():
+        db = get_db()
+        version = CatalogVersion.current(db, shop_id)
+        db.execute("UPDATE products SET price = 120 WHERE id = ?;", (product_ids[0],))
+        assert CatalogVersion.current(db, shop_id) == version + 1
+        db.execute("UPDATE products SET quantity = quantity + 5, last_purchase_rate = 70 WHERE id = ?;", (product_ids[0],))
+        assert CatalogVersion.current(db, shop_id) == version + 2
+        db.rollback()
@@ -0,0 +1,44 @@
+from app.db import get_db
+from app.models.catalog_change import CatalogChange
+
+
+def _feed(client, cursor):
+    return client.get(f"/manager/changes?cursor={cursor}").get_json()
+
+
+def test_a_cursor_behind_a_fully_pruned_log_is_reset(app, seed_shop, login):
+    shop_id, _, _ = seed_shop(products=3, sales=0)
+    client = login()
+    with app.app_context():
+        db = get_db()
+        latest = CatalogChange.latest_cursor(db, shop_id)
+        assert latest > 0
+        db.execute("UPDATE catalog_changes SET changed_at = datetime('now', '-90 days');")
+        assert CatalogChange.prune(db, 30) > 0
+        db.commit()
+        assert db.execute("SELECT COUNT(*) FROM catalog_changes;").fetchone()[0] == 0
+        assert CatalogChange.pruned_through(db) == latest
+
+    stale = _feed(client, latest - 1)
+    assert stale["reset"] is True
+    assert stale["cursor"] == latest
+
+    assert _feed(client, stale["cursor"])["reset"] is False
+
+
+def test_prune_keeps_a_suffix_of_the_log(app, seed_shop, login):
+    shop_id, _, _ = seed_shop(products=4, sales=0)
+    client = login()
+    with app.app_context():
+        db = get_db()
+        ids = [row[0] for row in db.execute("SELECT id FROM catalog_changes ORDER BY id;")]
+        # The clock stepped back: an older-looking row after a newer one.
+        db.execute("UPDATE catalog_changes SET changed_at = datetime('now', '-90 days') WHERE id IN (?, ?);", (ids[0], ids[2]))
+        CatalogChange.prune(db, 30)
+        db.commit()
+        remaining = [row[0] for row in db.execute("SELECT id FROM catalog_changes ORDER BY id;")]
+        assert remaining == ids[3:]
+        assert CatalogChange.pruned_through(db) == ids[2]
+
+    assert _feed(client, ids[1])["reset"] is True
+    assert _feed(client, ids[2])["reset"] is False
@@ -0,0 +1,38 @@
+import base64
+import json
+
+import pytest
+
+
+def _token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+FORGED = [
+    _token([[1, 2], 5]),
+    _token([{"a": 1}, 5]),
+    _token(["2026-01-01", [5]]),
+    _token(["2026-01-01", "5"]),
+    _token({"a": 1, "b": 2}),
+    "not-a-cursor",
+]
+
+
+@pytest.mark.parametrize("token", FORGED)
+def test_forged_cursors_fall_back_to_the_first_page(app, seed_shop, login, token):
+    _, product_ids, customer_ids = seed_shop(products=5, sales=20, customers=3)
+    client = login()
+
+    for path in (
+        f"/manager/customers?after={token}",
+        f"/manager/customers?before={token}&sort=sale_total",
+        f"/manager/sales/journal?before={token}",
+        f"/manager/sales/journal?before={token}&product_id={product_ids[0]}",
+        f"/manager/customers/{customer_ids[0]}?before={token}",
+        f"/manager/products/{product_ids[0]}/sales?before={token}",
+    ):
+        assert client.get(path).status_code == 200, path
+
+    response = client.get(f"/manager/sales/journal?before={token}", headers={"Accept": "application/json"})
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "ok"
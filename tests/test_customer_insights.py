@@ -0,0 +1,109 @@
+import pytest
+
+from app.db import get_db
+from app.models.customer import Customer
+from app.models.sale import Sale
+
+
+def _per_customer_loop(db, shop_id, *, net_of_returns):
+    """The ledger as the old per-customer loop computed it, one query per customer.
+
+    Without ``net_of_returns`` this is the original loop: sales only, costed at
+    each product's latest restock rate. With it, returns are taken back off at
+    the cost each line was snapshotted with, as customer_stats keeps them.
+    """
+    product_latest = {}
+    for row in db.execute("""
+        SELECT product_id, purchase_rate
+        FROM stock_batches
+        WHERE shop_id = ?
+        ORDER BY batch_date, created_at, id;
+    """, (shop_id,)):
+        product_latest[row["product_id"]] = row["purchase_rate"]
+
+    insights = []
+    for customer in Customer.all_by_shop(db, shop_id):
+        rows = db.execute("""
+            SELECT s.sale_type, s.created_at, si.product_id, si.quantity, si.unit_price, si.unit_cost
+            FROM sales s
+            JOIN sale_items si ON si.sale_id = s.id
+            WHERE s.shop_id = ? AND s.customer_id = ?;
+        """, (shop_id, customer["id"])).fetchall()
+
+        item_count, sale_total, purchase_total, last_purchase = 0, 0.0, 0.0, None
+        has_sale = False
+        for row in rows:
+            if row["sale_type"] == "return" and not net_of_returns:
+                continue
+            sign = 1 if row["sale_type"] == "sale" else -1
+            rate = row["unit_cost"] if net_of_returns else product_latest.get(row["product_id"])
+            item_count += sign * row["quantity"]
+            sale_total += sign * row["quantity"] * row["unit_price"]
+            purchase_total += sign * row["quantity"] * (rate or 0.0)
+            if row["sale_type"] == "sale":
+                has_sale = True
+                if last_purchase is None or row["created_at"] > last_purchase:
+                    last_purchase = row["created_at"]
+
+        # Listed once they have bought anything, even if it all came back.
+        if has_sale:
+            insights.append({
+                "id": customer["id"],
+                "name": customer["name"],
+                "phone": customer["phone"],
+                "item_count": item_count,
+                "sale_total": sale_total,
+                "purchase_total": purchase_total,
+                "last_purchase": last_purchase,
+                "profit_pct": ((sale_total - purchase_total) / purchase_total) * 100 if purchase_total > 0 else None,
+            })
+    return insights
+
+
+def _ledger(db, shop_id):
+    insights, _, has_next = Customer.ledger_page(db, shop_id, sort="name", limit=10_000)
+    assert not has_next
+    return insights
+
+
+def _assert_same(actual, expected):
+    assert expected
+    assert [row["id"] for row in actual] == [row["id"] for row in expected]
+    for got, want in zip(actual, expected):
+        for key, value in want.items():
+            if isinstance(value, float):
+                assert got[key] == pytest.approx(value), (want["name"], key)
+            else:
+                assert got[key] == value, (want["name"], key)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_ledger_matches_the_per_customer_loop(app, seed_shop, seed):
+    shop_id, _, _ = seed_shop(products=25, sales=600, customers=60, seed=seed)
+    with app.app_context():
+        db = get_db()
+        _assert_same(_ledger(db, shop_id), _per_customer_loop(db, shop_id, net_of_returns=False))
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_ledger_matches_the_per_customer_loop_net_of_returns(app, seed_shop, seed):
+    shop_id, _, _ = seed_shop(products=25, sales=600, customers=60, returns=150, seed=seed)
+    with app.app_context():
+        db = get_db()
+        _assert_same(_ledger(db, shop_id), _per_customer_loop(db, shop_id, net_of_returns=True))
+
+
+def test_a_customer_who_returned_everything_stays_on_the_ledger(app, seed_shop):
+    shop_id, product_ids, customer_ids = seed_shop(products=2, sales=0, customers=1)
+    with app.app_context():
+        db = get_db()
+        items = [{"product_id": product_ids[0], "quantity": 2, "unit_price": 100.0, "unit_cost": 60.0}]
+        sale_id = Sale.record(db, shop_id, "sale", items, customer_id=customer_ids[0])
+        Sale.record(db, shop_id, "return", items, customer_id=customer_ids[0], reference_sale_id=sale_id)
+        db.commit()
+
+        [row] = _ledger(db, shop_id)
+        assert row["id"] == customer_ids[0]
+        assert row["item_count"] == 0
+        assert row["sale_total"] == pytest.approx(0.0)
+        _assert_same(_ledger(db, shop_id), _per_customer_loop(db, shop_id, net_of_returns=True))
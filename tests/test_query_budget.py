@@ -0,0 +1,129 @@
+import re
+
+import pytest
+
+from app.db import get_db
+
+# Most statements each manager page may run, however large the shop grows.
+PAGE_STATEMENT_BUDGET = {
+    "/manager/": 7,
+    "/manager/products": 7,
+    "/manager/stock": 6,
+    "/manager/sales": 5,
+    "/manager/reports": 5,
+    "/manager/customers": 5,
+    "/manager/brands": 6,
+    "/manager/categories": 6,
+    "/manager/settings": 4,
+}
+
+_SCAN_RE = re.compile(r"^SCAN (\S+)( VIRTUAL TABLE)?")
+_ALIAS_RE = re.compile(
+    r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|LEFT\b|CROSS\b|INNER\b|GROUP\b|ORDER\b|LIMIT\b)(\w+))?",
+    re.I,
+)
+# Tables a hot query may read in full: SQLite's own catalog, which
+# ProductSearch consults to see whether the FTS5 table exists.
+SCAN_ALLOWED = {"sqlite_master"}
+
+
+@pytest.mark.parametrize("path", sorted(PAGE_STATEMENT_BUDGET))
+def test_page_statement_count_does_not_grow_with_the_shop(seed_shop, add_history, login, statements, path):
+    shop_id, _, _ = seed_shop(products=3, sales=5, customers=2, returns=1)
+    client = login()
+    assert client.get(path).status_code == 200
+    small = list(statements)
+
+    add_history(shop_id, products=60, sales=300, customers=40, returns=30, seed=11)
+    assert client.get(path).status_code == 200
+
+    assert len(statements) == len(small), "\n".join(statements)
+    assert len(statements) <= PAGE_STATEMENT_BUDGET[path], "\n".join(statements)
+
+
+def _table_scans(db, sql):
+    """Plan lines of ``sql`` that read a whole table (under any alias) outside SCAN_ALLOWED.
+
+    FTS5 lookups show up as SCAN ... VIRTUAL TABLE INDEX, which is a match
+    query, not a full read; scans of subqueries and constant rows name no table.
+    """
+    tables = {}
+    for table, alias in _ALIAS_RE.findall(sql):
+        tables[table.lower()] = table.lower()
+        if alias:
+            tables[alias.lower()] = table.lower()
+    plan = [row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    scans = []
+    for line in plan:
+        match = _SCAN_RE.match(line)
+        if not match or match.group(2):
+            continue
+        table = tables.get(match.group(1).lower())
+        if table is not None and table not in SCAN_ALLOWED:
+            scans.append(line)
+    return scans
+
+
+def test_hot_queries_use_indexes(app, seed_shop, login, statements):
+    shop_id, product_ids, customer_ids = seed_shop(products=30, sales=400, customers=20, returns=40)
+    client = login()
+    with app.app_context():
+        db = get_db()
+        sale_id = db.execute("SELECT MAX(id) FROM sales WHERE sale_type = 'sale';").fetchone()[0]
+        sale_date = db.execute("SELECT sale_date FROM sales WHERE id = ?;", (sale_id,)).fetchone()[0]
+        batch_date = db.execute("SELECT MAX(batch_date) FROM stock_batches;").fetchone()[0]
+        brand_id = db.execute("SELECT id FROM brands WHERE shop_id = ?;", (shop_id,)).fetchone()[0]
+        category_id = db.execute("SELECT id FROM categories WHERE shop_id = ?;", (shop_id,)).fetchone()[0]
+
+    paths = [
+        "/manager/",
+        "/manager/products",
+        "/manager/sales",
+        "/manager/stock",
+        "/manager/reports?sales_report_start=2026-01-01&sales_report_end=2026-12-31",
+        "/manager/customers",
+        "/manager/customers?sort=sale_total&dir=desc",
+        "/manager/customers?q=Customer",
+        "/manager/brands",
+        "/manager/categories",
+        "/manager/settings",
+        f"/manager/brands/{brand_id}",
+        f"/manager/categories/{category_id}",
+        f"/manager/stock_batches/{batch_date}",
+        f"/manager/sales/reports/{sale_date}",
+        f"/manager/sales/{sale_id}/return",
+        "/manager/sales/journal",
+        "/manager/sales/journal?type=return",
+        f"/manager/sales/journal?customer_id={customer_ids[0]}",
+        f"/manager/sales/journal?product_id={product_ids[0]}",
+        f"/manager/customers/{customer_ids[0]}",
+        f"/manager/products/{product_ids[0]}/sales",
+        f"/manager/products/{product_ids[0]}/purchases",
+        "/manager/products/search?q=Product",
+        "/manager/products/search?q=&in_stock=1",
+        "/manager/customers/lookup?q=Cust",
+        "/manager/changes?cursor=0",
+    ]
+    checked = 0
+    for path in paths:
+        assert client.get(path).status_code == 200, path
+        queries = [sql for sql in statements if sql.lstrip().upper().startswith(("SELECT", "WITH"))]
+        with app.app_context():
+            db = get_db()
+            for sql in queries:
+                assert not _table_scans(db, sql), f"{path}:\n{sql}"
+                checked += 1
+    assert checked
+
+
+@pytest.mark.parametrize("query", ["", "&type=return"])
+def test_product_journal_walks_the_products_lines(app, seed_shop, login, statements, query):
+    _, product_ids, _ = seed_shop(products=30, sales=400, customers=20, returns=40)
+    client = login()
+    assert client.get(f"/manager/sales/journal?product_id={product_ids[0]}{query}").status_code == 200
+
+    [sql] = [sql for sql in statements if "FROM sale_items si" in sql and "DISTINCT" in sql]
+    with app.app_context():
+        plan = [row[3] for row in get_db().execute(f"EXPLAIN QUERY PLAN {sql}")]
+    assert "ix_sale_items_product_created" in plan[0], plan
+    assert not any("ORDER BY" in line for line in plan), plan
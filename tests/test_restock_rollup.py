@@ -0,0 +1,59 @@
+import re
+
+import pytest
+
+from app.db import get_db
+from app.models.stock_batch import StockBatch
+
+_GROUP_BY_DATE = """
+    SELECT batch_date, COUNT(*) AS product_count, SUM(purchase_rate * quantity) AS total_purchase
+    FROM stock_batches
+    WHERE shop_id = ?
+    GROUP BY batch_date
+    ORDER BY batch_date DESC;
+"""
+
+
+def _rollup(db, shop_id):
+    rows, has_more = StockBatch.summary_by_date(db, shop_id, limit=10_000)
+    assert not has_more
+    return [(row["batch_date"], row["product_count"], pytest.approx(row["total_purchase"])) for row in rows]
+
+
+def test_rollup_follows_restocks_and_product_deletes(app, seed_shop, login):
+    shop_id, product_ids, _ = seed_shop(products=40, sales=0)
+    client = login()
+    with app.app_context():
+        db = get_db()
+        dates = [row[0] for row in db.execute("SELECT DISTINCT batch_date FROM stock_batches;")]
+        StockBatch.create_many(db, shop_id, [
+            {"product_id": pid, "quantity": 3, "purchase_rate": 12.5, "sale_price": 20, "batch_date": dates[idx % 3]}
+            for idx, pid in enumerate(product_ids[:10])
+        ])
+        db.commit()
+
+    for product_id in product_ids[5:25]:
+        client.post("/manager/products/delete", data={"delete_product_id": product_id})
+
+    with app.app_context():
+        db = get_db()
+        expected = [tuple(row) for row in db.execute(_GROUP_BY_DATE, (shop_id,))]
+        assert expected
+        assert _rollup(db, shop_id) == expected
+
+
+def test_stock_page_pages_through_restock_dates(app, seed_shop, login):
+    shop_id, _, _ = seed_shop(products=80, sales=0)
+    client = login()
+    with app.app_context():
+        expected = [row["batch_date"] for row in get_db().execute(_GROUP_BY_DATE, (shop_id,))]
+
+    dates, url, pages = [], "/manager/stock", 0
+    while url:
+        html = client.get(url).get_data(as_text=True)
+        dates += re.findall(r"/manager/stock_batches/(\d{4}-\d{2}-\d{2})", html)
+        pages += 1
+        match = re.search(r'href="([^"]*)">Older', html)
+        url = match.group(1).replace("&amp;", "&") if match else None
+    assert dates == expected
+    assert pages > 1
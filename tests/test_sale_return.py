@@ -0,0 +1,73 @@
+import pytest
+
+from app.db import get_db
+from app.models.sale import Sale
+
+
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_a_return_checked_against_a_stale_read_is_refused(app, seed_shop, login, monkeypatch, group_commit):
+    app.config["GROUP_COMMIT"] = group_commit
+    shop_id, _, _ = seed_shop(products=3, sales=1)
+    client = login()
+    with app.app_context():
+        db = get_db()
+        sale_id = db.execute("SELECT id FROM sales WHERE shop_id = ?;", (shop_id,)).fetchone()[0]
+        _, items = Sale.get_with_items(db, shop_id, sale_id)
+    line = items[0]
+
+    def return_all():
+        return client.post(f"/manager/sales/{sale_id}/return", data={
+            "return_sale_item_id[]": [str(line["id"])],
+            "return_quantity[]": [str(line["quantity"])],
+            "return_price[]": [str(line["unit_price"])],
+        })
+
+    assert return_all().status_code == 302
+
+    # A second request that read the line before the first one committed.
+    fresh_read = Sale.get_with_items
+    monkeypatch.setattr(
+        Sale,
+        "get_with_items",
+        lambda db, shop_id, sale_id: (
+            fresh_read(db, shop_id, sale_id)[0],
+            items,
+        ),
+    )
+    assert return_all().status_code == 302
+
+    with app.app_context():
+        db = get_db()
+        returns = db.execute("SELECT COUNT(*) FROM sales WHERE sale_type = 'return';").fetchone()[0]
+        returned = db.execute("SELECT returned_quantity FROM sale_items WHERE id = ?;", (line["id"],)).fetchone()[0]
+        quantity = db.execute("SELECT quantity FROM products WHERE id = ?;", (line["product_id"],)).fetchone()[0]
+    assert returns == 1
+    assert returned == line["quantity"]
+    assert quantity == 1000000 + line["quantity"]  # restocked once
+
+
+def test_mark_returned_updates_a_whole_invoice_in_one_statement(app, seed_shop):
+    shop_id, product_ids, _ = seed_shop(products=3, sales=0)
+    with app.app_context():
+        db = get_db()
+        items = [{"product_id": pid, "quantity": 2, "unit_price": 100.0} for pid in product_ids * 100]
+        sale_id = Sale.record(db, shop_id, "sale", items)
+        _, lines = Sale.get_with_items(db, shop_id, sale_id)
+        db.execute("UPDATE sale_items SET returned_quantity = 2 WHERE id = ?;", (lines[5]["id"],))
+
+        traced = []
+        db.set_trace_callback(traced.append)
+        over = Sale.mark_returned(db, {line["id"]: 1 for line in lines})
+        db.set_trace_callback(None)
+
+        assert over == [lines[5]["id"]]
+        assert sum(sql.lstrip().startswith("UPDATE sale_items") for sql in traced) == 3  # 300 lines, 125 a chunk
+        rows = db.execute(
+            "SELECT returned_quantity, returned_at FROM sale_items WHERE sale_id = ? ORDER BY id;", (sale_id,)
+        ).fetchall()
+        assert [row["returned_quantity"] for row in rows] == [2 if idx == 5 else 1 for idx in range(300)]
+        assert all(row["returned_at"] is None for row in rows)
+        # Returning the last unit marks the line fully returned.
+        assert Sale.mark_returned(db, {lines[0]["id"]: 1}) == []
+        assert db.execute("SELECT returned_at FROM sale_items WHERE id = ?;", (lines[0]["id"],)).fetchone()[0]
+        db.rollback()
@@ -0,0 +1,23 @@
+import pytest
+
+from app.db import get_db
+
+
+@pytest.mark.parametrize("unit_price", ["nan", "inf", "-inf", "-1"])
+def test_sync_rejects_prices_that_are_not_finite_and_non_negative(app, seed_shop, login, unit_price):
+    shop_id, product_ids, _ = seed_shop(products=1, sales=0)
+    client = login()
+    item = {"product_id": product_ids[0], "quantity": 1}
+    response = client.post("/manager/sales/sync", json={"sales": [
+        {"client_key": "bad", "items": [{**item, "unit_price": unit_price}]},
+        {"client_key": "good", "items": [{**item, "unit_price": 100}]},
+    ]})
+    assert response.status_code == 200
+
+    bad, good = response.get_json()["results"]
+    assert bad == {"client_key": "bad", "status": "failed", "error": "Enter a valid sale price."}
+    assert good["status"] == "recorded"
+    with app.app_context():
+        db = get_db()
+        totals = db.execute("SELECT SUM(sales_total) FROM daily_sales_rollup WHERE shop_id = ?;", (shop_id,))
+        assert totals.fetchone()[0] == 100
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+from app import create_app
+from app.db import begin_write, get_db
+
+
+@pytest.fixture
+def app(tmp_path):
+    # No retries and a short busy timeout, so a held lock fails fast.
+    app = create_app({
+        "DB_PATH": str(tmp_path / "test.db"),
+        "TESTING": True,
+        "DB_BUSY_TIMEOUT_MS": 10,
+        "DB_WRITE_RETRIES": 0,
+    })
+    yield app
+    app.extensions["db_pool"].close_all()
+
+
+@pytest.fixture
+def locked(app):
+    """Another connection holding the write lock for the duration of the test."""
+    holder = sqlite3.connect(app.config["DB_PATH"], isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE;")
+    yield
+    holder.execute("ROLLBACK;")
+    holder.close()
+
+
+def _flashes(client):
+    with client.session_transaction() as session:
+        return [message for _, message in session.pop("_flashes", [])]
+
+
+def test_write_routes_ask_to_retry_when_the_lock_stays_busy(app, seed_shop, login, request):
+    shop_id, product_ids, customer_ids = seed_shop(products=2, sales=0, customers=1)
+    client = login()
+    request.getfixturevalue("locked")
+
+    forms = [
+        ("/manager/products/add_stock", {"product_id": str(product_ids[0]), "stock_quantity": "5",
+                                         "purchase_rate": "10", "stock_sale_price": "20"}),
+        ("/manager/products/delete", {"delete_product_id": str(product_ids[1])}),
+        ("/manager/customers/delete", {"customer_id": str(customer_ids[0])}),
+    ]
+    for path, form in forms:
+        response = client.post(path, data=form, headers={"Referer": "http://localhost/manager/stock"})
+        assert response.status_code == 302, path
+        assert response.headers["Location"].endswith("/manager/stock"), path
+        assert any("try again" in message for message in _flashes(client)), path
+
+    response = client.post("/manager/products/delete", data={"delete_product_id": str(product_ids[1])},
+                           headers={"X-Requested-With": "XMLHttpRequest"})
+    assert response.status_code == 503
+    assert response.get_json()["status"] == "failed"
+
+    response = client.post("/manager/sales/sync", json={"sales": [{
+        "client_key": "till-1", "items": [{"product_id": product_ids[0], "quantity": 1, "unit_price": 100}],
+    }]})
+    assert response.status_code == 503
+
+    with app.app_context():
+        db = get_db()
+        assert db.execute("SELECT COUNT(*) FROM products WHERE shop_id = ?;", (shop_id,)).fetchone()[0] == 2
+        assert db.execute("SELECT COUNT(*) FROM customers WHERE shop_id = ?;", (shop_id,)).fetchone()[0] == 1
+        assert db.execute("SELECT COUNT(*) FROM sales;").fetchone()[0] == 0
+
+
+def test_begin_write_refuses_an_already_open_transaction(app):
+    with app.test_request_context():
+        db = get_db()
+        db.execute("UPDATE users SET full_name = full_name;")
+        assert db.in_transaction
+        with pytest.raises(RuntimeError):
+            begin_write(db)
+        db.rollback()